@@ -1,11 +1,16 @@
 import lib.stddraw as stddraw  # for creating an animation with user interactions
-from lib.picture import Picture  # used for displaying an image on the game menu
 from lib.color import Color  # used for coloring the game menu
 import os  # the os module is used for file and directory operations
 from game_grid import GameGrid  # the class for modeling the game grid
-from tetromino import Tetromino  # the class for modeling the tetrominoes
-import random  # used for creating tetrominoes with random types (shapes)
+from simulation import GameSimulation, snapshot_piece  # used for running the game
+from replay import ReplayRecorder  # used for recording games to export as clips
+from savegame import Autosaver, load_game  # used for resuming interrupted games
+from stats import GameCounter, StatsStore  # used for the results of the games
 import time  # used for timing operations like tracking tetromino falls
+import asyncio  # used for running the screens and the background work together
+import atexit  # used for storing the last results when the program exits
+import sys  # used for reporting the errors of background work
+import traceback  # used for reporting the errors of background work
 
 DIFFICULTIES = {
     "Easy":     0.75,  # Slower fall speed for easier gameplay
@@ -15,10 +20,64 @@ DIFFICULTIES = {
 }
 FPS        = 60  # Frames per second for smooth animation
 FRAME_MS   = int(1000 / FPS)  # Milliseconds per frame
+IDLE_POLL_SEC = 0.05  # Time between two checks for input on screens that wait for the player
+
+# Colors of the menu, side panel and overlay messages, created once and reused
+MENU_BG_COLOR     = Color(42, 69, 99)  # Menu background
+TEXT_COLOR        = Color(255, 255, 255)  # Titles, score and instructions
+BUTTON_COLOR      = Color(25, 255, 228)  # Difficulty button fill
+BUTTON_TEXT_COLOR = Color(31, 160, 239)  # Difficulty button labels
+PREVIEW_BOX_COLOR = Color(200, 200, 200)  # Frame around the next piece
+PAUSE_COLOR       = Color(255, 255, 0)  # Pause message
+GAME_OVER_COLOR   = Color(0, 255, 0)  # Game over / win message
+
+
+# Tasks started with run_in_background that have not finished yet
+_background_tasks = set()
+
+
+# A function that runs function(*args) on a worker thread of the event loop,
+# for work that would otherwise hold up the frames and whose result nobody
+# waits for (e.g. compressing a replay). An error of the work is reported on
+# stderr, since no one else would see it.
+def run_in_background(function, *args):
+    task = asyncio.ensure_future(
+        asyncio.get_running_loop().run_in_executor(None, function, *args))
+    _background_tasks.add(task)  # Keep the task alive until it finishes
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_report_failure)
+    return task
+
+
+def _report_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        error = task.exception()
+        print("Background work failed:", file=sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+
+# A coroutine that displays the frame drawn since frame_start and gives the
+# other tasks the rest of the frame time
+async def show_frame(frame_start):
+    stddraw.show(0)  # Display frame
+    await asyncio.sleep(max(0, frame_start + FRAME_MS / 1000 - time.time()))
+
+
+# A coroutine that sleeps until the player does something, letting the other
+# tasks run in the meantime. The events are handled on this thread, which is
+# the one that made the window, as SDL requires.
+async def wait_for_input():
+    while not stddraw.pollEvents():
+        await asyncio.sleep(IDLE_POLL_SEC)
 
 
 # The main function where this program starts execution
-def play_one_game(fall_delay, grid_h=20, grid_w_main=12):
+# (if a ReplayRecorder is given, the game is recorded into it; if an Autosaver
+# is given, the game is saved with it every now and then; if a SavedGame is
+# given, that game is resumed instead of starting a new one; if a StatsStore is
+# given, the result of the game is stored in it under the difficulty)
+async def play_one_game(fall_delay, grid_h=20, grid_w_main=12, recorder=None,
+                  autosaver=None, saved=None, stats=None, difficulty=None):
     # Set up the game area with a main grid and a side panel
     right_panel_w = 6  # Width of the panel showing next piece and score
     grid_w_total = grid_w_main + right_panel_w  # Total width of the game window
@@ -27,98 +86,105 @@ def play_one_game(fall_delay, grid_h=20, grid_w_main=12):
     stddraw.setXscale(-0.5, grid_w_total-0.5)
     stddraw.setYscale(-0.5, grid_h-0.5)
 
-    # Initialize the Tetromino class with grid dimensions
-    Tetromino.grid_height = grid_h
-    Tetromino.grid_width  = grid_w_main
-    grid = GameGrid(grid_h, grid_w_main)  # Create the game grid
+    # The game runs on its own thread; this loop forwards the input to it and
+    # draws the latest snapshot of the game
+    game = GameSimulation(fall_delay, grid_h, grid_w_main, recorder, autosaver, saved)
+    counter = GameCounter(resumed=saved is not None) if stats else None
+    if counter:  # Count the pieces, merges and cleared rows as the game goes
+        game.grid.add_listener(counter)
+    game.start()
+    grid = GameGrid(grid_h, grid_w_main)  # The grid drawn from the snapshots
+    shown = None  # Snapshot drawn in the last frame
+    next_tetromino = None  # Next piece of the snapshot drawn in the last frame
+
+    # Main render loop
+    while True:
+        frame_start = time.time()
+        # Forward every key event queued since the last frame, in order
+        sent = False
+        while stddraw.hasNextKeyEvent():
+            event = stddraw.nextKeyEvent()
+            if event.kind == stddraw.KEY_DOWN and event.key == "f12":
+                stddraw.screenshot()  # Take a screenshot, written in the background
+            else:
+                game.send(event)
+                sent = True
+        if sent and shown is not None and shown.paused:
+            # Nothing else changes while paused, so give the game a moment to handle the keys
+            await asyncio.get_running_loop().run_in_executor(
+                None, game.wait, shown.version, FRAME_MS / 1000)
 
-    # Create initial tetrominoes
-    next_tetromino   = create_tetromino()  # Generate the next piece
-    current          = next_tetromino  # Set the current falling piece
-    next_tetromino   = create_tetromino()  # Generate another piece for "next"
-    grid.current_tetromino = current  # Assign current tetromino to the grid
+        snapshot = game.snapshot
+        if snapshot.result == "menu":  # The player left the game from the pause screen
+            game.stop()
+            return "menu"             # back to menu
+        if snapshot.result == "over":  # Exit the render loop if the game has ended
+            game.stop()
+            break
 
-    last_fall = time.time()  # Track time of last tetromino fall
-    paused    = False  # Game starts unpaused
+        if snapshot is not shown:  # Draw only when the game has changed
+            next_tetromino = show_snapshot(grid, snapshot, shown, next_tetromino)
+            draw_frame(grid, next_tetromino)  # Draw everything
+            if snapshot.paused:
+                draw_pause(grid_w_total, grid_h)  # Show pause message
+                stddraw.show(0)  # Display the pause screen once
+            shown = snapshot
+        if snapshot.paused:  # Nothing changes while paused
+            await wait_for_input()  # Sleep until the player does something
+            continue
+        await show_frame(frame_start)  # Display frame and control timing
 
-    # Main game loop
-    while True:
-        # Handle user input
-        if stddraw.hasNextKeyTyped():  # Check if any key is pressed
-            key = stddraw.nextKeyTyped()  # Get the key
-            if key == "p":  # Toggle pause
-                paused = not paused
-            elif paused and key == "m":  # Return to menu when paused
-                return "menu"             # back to menu
-            elif paused:
-                pass                      # ignore other keys while paused
-            elif key in ("left", "right", "down"):  # Handle movement keys
-                current.move(key, grid)
-            elif key == "up":  # Handle rotation
-                current.move("rotate", grid)
-            elif key == "space":  # Hard drop - move down until collision
-                while current.move("down", grid): pass
-            stddraw.clearKeysTyped()  # Clear input buffer
-
-        if paused:  # If game is paused
-            draw_frame(grid, next_tetromino)  # Draw the current state
-            draw_pause(grid_w_total, grid_h)  # Show pause message
-            stddraw.show(FRAME_MS)  # Display frame and wait
-            continue  # Skip the rest of the loop
-
-        # Apply gravity to make pieces fall
-        if time.time() - last_fall >= fall_delay:  # If it's time for piece to fall
-            if not current.move("down", grid):  # Try to move down
-                # If can't move down, handle piece locking
-                tiles, pos = current.get_min_bounded_tile_matrix(True)  # Get minimal piece representation
-                if grid.update_grid(tiles, pos):  # Lock piece and update grid
-                    break  # Game over if update_grid returns True
-                # Prepare the next piece
-                current, next_tetromino = next_tetromino, create_tetromino()
-                grid.current_tetromino = current
-            last_fall = time.time()  # Reset the fall timer
-        if grid.win:  # Check win condition
-            break  # Exit game loop if won
-            
-        # Render game state
-        draw_frame(grid, next_tetromino)  # Draw everything
-        stddraw.show(FRAME_MS)  # Display frame and control timing
-
-    # Game over loop
+    best = None
+    if stats:  # Store the result; it is written to the database in the background
+        max_exponent = int(snapshot.board.max())
+        stats.record(counter.record(difficulty, snapshot.score,
+                                    1 << max_exponent if max_exponent else 0,
+                                    snapshot.win))
+        best = stats.best_score(difficulty)
+
+    # Game over screen, drawn once since nothing changes on it
+    next_tetromino = show_snapshot(grid, snapshot, shown, next_tetromino)
+    draw_frame(grid, next_tetromino)  # Draw final game state
+    draw_game_over(grid_w_total, grid_h, grid.win, best)  # Show game over message
+    stddraw.show(0)  # Display frame
     while True:  # Loop until player chooses to go back to menu
-        draw_frame(grid, next_tetromino)  # Draw final game state
-        draw_game_over(grid_w_total, grid_h, grid.win)  # Show game over message
-        stddraw.show(FRAME_MS)  # Display frame
-        if stddraw.hasNextKeyTyped():  # Check for key press
-            key = stddraw.nextKeyTyped()  # Get key
-            stddraw.clearKeysTyped()  # Clear input buffer
-            if key == "m":  # Return to menu
+        await wait_for_input()  # Sleep until the player does something
+        while stddraw.hasNextKeyTyped():  # Check every key pressed
+            if stddraw.nextKeyTyped() == "m":  # Return to menu
                 return "menu"
 
+# Put the state of a game snapshot on the grid that is drawn, rebuilding only
+# what changed since the snapshot shown before, and return the next piece
+def show_snapshot(grid, snapshot, shown, next_tetromino):
+    if shown is None or snapshot.board is not shown.board:
+        grid.set_exponent_matrix(snapshot.board)
+    grid.score, grid.win = snapshot.score, snapshot.win
+    if shown is None or snapshot.current is not shown.current:
+        grid.current_tetromino = snapshot_piece(snapshot.current)
+    if shown is None or snapshot.next is not shown.next:
+        next_tetromino = snapshot_piece(snapshot.next)
+    return next_tetromino
+
 # Draw pause message overlay
 def draw_pause(grid_w_total, grid_h):
     # Display pause instructions in yellow text
-    stddraw.setPenColor(Color(255, 255, 0))
+    stddraw.setPenColor(PAUSE_COLOR)
     stddraw.boldText(grid_w_total/2, grid_h/2, "PAUSED  (P=res,  M=menu)")
 
-# Draw game over/win message overlay
-def draw_game_over(grid_w_total, grid_h, win):
+# Draw game over/win message overlay (with the best score of the difficulty,
+# if it is known)
+def draw_game_over(grid_w_total, grid_h, win, best=None):
     # Show appropriate message based on win status
     msg = "YOU WIN!" if win else "GAME OVER"
-    stddraw.setPenColor(Color(0, 255, 0))
+    stddraw.setPenColor(GAME_OVER_COLOR)
     stddraw.boldText(grid_w_total/2, grid_h/2 + 1, msg)
     stddraw.setFontSize(25)
     stddraw.boldText(grid_w_total/2, grid_h/2 - 1, "Press M for menu")
-
-# A function for creating random shaped tetrominoes to enter the game grid
-def create_tetromino():
-    # Define all possible tetromino shapes
-    tetromino_types = ['I', 'O', 'Z', 'J', 'L', 'S', 'T']
-    # Return a tetromino of random shape
-    return Tetromino(random.choice(tetromino_types))
+    if best is not None:
+        stddraw.boldText(grid_w_total/2, grid_h/2 - 2.5, f"BEST: {best}")
 
 # A function for displaying a simple menu before starting the game
-def show_menu(grid_h, grid_w_total):
+async def show_menu(grid_h, grid_w_total):
     # Set up the canvas only if it hasn't been created
     if not stddraw._windowCreated:          # only first time
         stddraw.setCanvasSize(40*grid_h, 40*grid_w_total)
@@ -127,9 +193,9 @@ def show_menu(grid_h, grid_w_total):
     stddraw.setYscale(-0.5, grid_h-0.5)
 
     # Draw static menu elements
-    stddraw.clear(Color(42, 69, 99))  # Set background color
+    stddraw.clear(MENU_BG_COLOR)  # Set background color
     stddraw.setFontFamily("Arial"); stddraw.setFontSize(32)  # Set font properties
-    stddraw.setPenColor(Color(255, 255, 255))  # Set text color to white
+    stddraw.setPenColor(TEXT_COLOR)  # Set text color to white
     stddraw.boldText(grid_w_total/2, grid_h - 3, "TETRIS 2048")  # Draw title
     
     # Display credits
@@ -148,12 +214,12 @@ def show_menu(grid_h, grid_w_total):
         x0 = (grid_w_total - btn_w)/2
         y0 = btn_y0 - i*2.0
         buttons.append((diff, x0, y0, btn_w, btn_h))  # Store button data
-        stddraw.setPenColor(Color(25, 255, 228))  # Button fill color
+        stddraw.setPenColor(BUTTON_COLOR)  # Button fill color
         stddraw.filledRectangle(x0, y0, btn_w, btn_h)  # Draw button
-        stddraw.setPenColor(Color(31, 160, 239))  # Button text color
+        stddraw.setPenColor(BUTTON_TEXT_COLOR)  # Button text color
         stddraw.boldText(x0 + btn_w/2, y0 + btn_h/2, diff)  # Draw button label
 
-    stddraw.show(10)    # Display the menu
+    stddraw.show(0)    # Display the menu once; it is not redrawn while waiting
 
     # Wait for mouse click on a difficulty button
     while True:  # Loop until a valid selection is made
@@ -162,13 +228,13 @@ def show_menu(grid_h, grid_w_total):
             uy = stddraw.mouseY()  # Get Y coordinate of mouse
             # Wait until mouse button is released (debounce)
             while stddraw.mousePressed():
-                stddraw.show(10)
+                await wait_for_input()
 
             # Check if click was on a button
             for diff, x0, y0, bw, bh in buttons:
                 if x0 <= ux <= x0 + bw and y0 <= uy <= y0 + bh:
                     return diff  # Return selected difficulty
-        stddraw.show(10)    # Small delay and update events
+        await wait_for_input()    # Sleep until the next input or window event
 
 
 # Function to draw the game frame including grid, current piece, next piece, and score
@@ -181,13 +247,13 @@ def draw_frame(grid, next_piece):
 
     # Define position for the next piece preview
     ox, oy = grid.grid_width + 2, grid.grid_height - 5
-    stddraw.setPenColor(Color(200, 200, 200))  # Set color for preview box
+    stddraw.setPenColor(PREVIEW_BOX_COLOR)  # Set color for preview box
     stddraw.rectangle(ox - 1.5 , oy - 1, 4, 5)  # Draw preview box
     next_piece.draw(preview=True, offset_x=ox-0.5, offset_y=oy)  # Draw next piece
     
     # Display score and controls
     stddraw.setFontFamily("Arial"); stddraw.setFontSize(20)
-    stddraw.setPenColor(Color(255, 255, 255))  # Set text color to white
+    stddraw.setPenColor(TEXT_COLOR)  # Set text color to white
     stddraw.boldText(grid.grid_width + 2.5, oy - 12,
                  f"SCORE: {grid.score}")  # Show current score
     
@@ -198,14 +264,57 @@ def draw_frame(grid, next_piece):
     stddraw.text(grid.grid_width + 2.5, oy - 3, "Up for Rotate")
 
 
-# Entry point of the program
-if __name__ == "__main__":
+# The coroutine that runs the program: menu → game → menu, with the work that
+# would hold up the frames done on worker threads
+async def main(args):
     grid_h, grid_w_main = 20, 12  # Set default grid dimensions
     right_panel_w = 6  # Width of information panel
     grid_w_total = grid_w_main + right_panel_w  # Total width of game window
 
+    autosaver = Autosaver(args.autosave) if args.autosave else None
+    stats = StatsStore(args.stats) if args.stats else None
+    if stats:  # Commit the last results when the program exits
+        atexit.register(stats.close)
+    saved = None
+    if args.autosave and os.path.exists(args.autosave):
+        try:  # Resume the game that was being played when the program stopped
+            saved = await asyncio.get_running_loop().run_in_executor(
+                None, load_game, args.autosave)
+        except (OSError, ValueError):
+            saved = None  # A damaged save is ignored and overwritten later
+
     # Main program loop - menu → game → menu
     while True:
-        diff = show_menu(grid_h, grid_w_total)  # Show menu and get difficulty selection
-        result = play_one_game(DIFFICULTIES[diff], grid_h, grid_w_main)  # Play game with selected difficulty
+        if saved:  # Skip the menu and continue the saved game
+            if not stddraw._windowCreated:  # The menu normally creates the canvas
+                stddraw.setCanvasSize(40*grid_h, 40*grid_w_total)
+            fall_delay = saved.fall_delay
+            diff = next((name for name, delay in DIFFICULTIES.items()
+                         if delay == fall_delay), "Custom")
+        else:
+            diff = await show_menu(grid_h, grid_w_total)  # Show menu and get difficulty selection
+            fall_delay = DIFFICULTIES[diff]
+        recorder = ReplayRecorder(grid_h, grid_w_main) if args.record else None
+        result = await play_one_game(fall_delay, grid_h, grid_w_main, recorder,
+                                     autosaver, saved, stats, diff)  # Play game with selected difficulty
+        saved = None
+        if recorder:  # Save the replay of the game under the time it ended,
+            os.makedirs(args.record, exist_ok=True)  # compressing it while the menu is shown
+            run_in_background(recorder.replay.save, os.path.join(
+                args.record, time.strftime("replay-%Y%m%d-%H%M%S.npz")))
         # Loop back to menu when game ends
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    import argparse  # used for reading the command line options
+    parser = argparse.ArgumentParser(description="Tetris 2048")
+    parser.add_argument("--record", metavar="DIR",
+                        help="save a replay of every game into DIR")
+    parser.add_argument("--autosave", metavar="FILE",
+                        help="save the game being played into FILE every few "
+                             "seconds and resume it from there on the next start")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="store the result of every game in the SQLite "
+                             "database FILE and show the best score")
+    asyncio.run(main(parser.parse_args()))
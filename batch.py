@@ -0,0 +1,381 @@
+import collections  # used for the summary of a job
+import glob  # used for finding the result shards
+import os  # used for the files of a job
+import random  # used for the random choices of the agent
+import signal  # used for checkpointing when the process is told to stop
+import socket  # used for naming the workers of a node
+import sqlite3  # used for the work queue
+import struct  # used for the checkpoint files
+import threading  # used for telling whether signals can be handled
+import time  # used for the leases and the checkpoint interval
+import zlib  # used for the checksum of the checkpoint files
+import numpy as np  # used for the result records
+from game_grid import GameGrid  # used for playing the placements
+from placements import enumerate_placements, play_placement
+from savegame import pack_state, unpack_state, write_atomically
+from tetromino import Tetromino, PieceStream  # the pieces of the games
+from tournament import load_agent  # agents are given as "module:function" names
+
+# A job is a directory holding:
+#   queue.sqlite:     the settings of the job and the work queue, one row per
+#                     game with its status (pending, running or done), the
+#                     worker running it and the time its lease ends
+#   results/*.t48r:   one result shard per worker, of fixed-size records
+#                     (RESULT_DTYPE) appended as games end
+#   checkpoints/:     the state of every game being played, saved every
+#                     checkpoint interval and when the worker is stopped
+# Workers on any node that sees the directory claim games from the queue. A
+# game whose worker stopped (its lease ran out) is claimed again and continues
+# from its checkpoint. Game i is played with the pieces of seed first_seed + i
+# and the agent gets a random.Random of the same seed, so a game gives the same
+# result however often it was stopped and resumed, and the summary of a job
+# is the same whichever workers played it.
+# SQLite needs a filesystem with working file locks (most local and NFSv4
+# filesystems).
+PENDING, RUNNING, DONE = 0, 1, 2
+RESULT_DTYPE = np.dtype([("game", "<u8"), ("score", "<u8"), ("win", "u1"),
+                         ("max_exponent", "u1"), ("pieces", "<u4")])
+
+# Layout of a checkpoint: magic, version, game, pieces placed, the state of the
+# agent's random.Random (624 words, the position in them and the cached gauss
+# value or NaN), the game as packed by savegame.pack_state, and the CRC-32 of
+# everything before it
+_CHECKPOINT = struct.Struct("<4sBxxxQI625Id")
+_CHECKPOINT_CRC = struct.Struct("<I")
+_CHECKPOINT_MAGIC = b"T48C"
+_CHECKPOINT_VERSION = 2
+_SETTINGS = ("agent", "games", "first_seed", "grid_h", "grid_w", "max_pieces")
+
+# The settings of a job
+Job = collections.namedtuple("Job", _SETTINGS)
+# The summary of the results of a job, computed from the records sorted by
+# game so that it does not depend on the order in which games ended
+Summary = collections.namedtuple(
+    "Summary", ["games", "missing", "total_score", "mean_score", "wins",
+                "win_rate", "mean_pieces", "max_tiles"])
+
+
+# A function that creates a job of the given number of games in directory
+def create_job(directory, agent, games, first_seed=0, grid_h=20, grid_w=12,
+               max_pieces=1000):
+    os.makedirs(os.path.join(directory, "results"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "checkpoints"), exist_ok=True)
+    with _connect(directory) as db:
+        if db.execute("SELECT COUNT(*) FROM settings").fetchone()[0]:
+            raise ValueError("%s already holds a job" % directory)
+        settings = Job(agent, games, first_seed, grid_h, grid_w, max_pieces)
+        db.executemany("INSERT INTO settings VALUES (?, ?)", zip(_SETTINGS, settings))
+        db.executemany("INSERT INTO games (id) VALUES (?)", ((i,) for i in range(games)))
+    return settings
+
+
+# A function that returns the settings of the job in directory
+def load_job(directory):
+    with _connect(directory) as db:
+        settings = dict(db.execute("SELECT key, value FROM settings"))
+    return Job(*(settings[key] for key in _SETTINGS))
+
+
+# A function that returns the number of games of the job in directory that
+# are pending, running and done
+def job_status(directory):
+    with _connect(directory) as db:
+        counts = dict(db.execute("SELECT status, COUNT(*) FROM games GROUP BY status"))
+    return tuple(counts.get(status, 0) for status in (PENDING, RUNNING, DONE))
+
+
+# A class for a worker of a job: it claims games from the queue a few at a
+# time, plays them, appends their results to its own shard and marks them
+# done, until no game is left to claim.
+class Worker:
+    def __init__(self, directory, checkpoint_sec=60.0, lease_sec=300.0, claim=4):
+        self.directory = directory
+        self.job = load_job(directory)
+        self.checkpoint_sec = checkpoint_sec  # Time between two checkpoints of a game
+        self.lease_sec = lease_sec  # Time without news after which a game can be taken over
+        self.claim = claim  # Games claimed at once
+        self.name = "%s-%d" % (socket.gethostname(), os.getpid())
+        self.agent = load_agent(self.job.agent)
+        self._stopping = False
+        # A worker may be made on one thread and run on another; it is only
+        # used by one thread at a time
+        self._db = _connect(directory, check_same_thread=False)
+        self._results = open(os.path.join(directory, "results", self.name + ".t48r"), "ab")
+
+    # A method that plays games until none is left or stop is called, and
+    # returns the number of games it finished. On the main thread, SIGTERM and
+    # SIGINT make it stop after checkpointing the game being played.
+    def run(self):
+        handled = threading.current_thread() is threading.main_thread()
+        if handled:
+            previous = {s: signal.signal(s, lambda *_: self.stop())
+                        for s in (signal.SIGTERM, signal.SIGINT)}
+        finished = 0
+        try:
+            while not self._stopping:
+                games = self._claim()
+                if not games:
+                    break
+                for i, game in enumerate(games):
+                    if not self._renew([game]):
+                        continue  # Taken over by another worker while this one was busy
+                    result = self._play(game)
+                    if result is None:  # Let other workers take the games over at once
+                        self._release(games[i:])
+                        break
+                    self._finish(result, games[i + 1:])
+                    finished += 1
+        finally:
+            if handled:
+                for s, handler in previous.items():
+                    signal.signal(s, handler)
+        return finished
+
+    # A method that makes run return once the game being played is checkpointed
+    def stop(self):
+        self._stopping = True
+
+    # A method that closes the queue and the result shard
+    def close(self):
+        self._db.close()
+        self._results.close()
+
+    def _claim(self):
+        now = time.time()
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")  # Only one worker claims at a time
+            games = [row[0] for row in self._db.execute(
+                "SELECT id FROM games WHERE status = ? OR (status = ? AND lease_until < ?) "
+                "ORDER BY id LIMIT ?", (PENDING, RUNNING, now, self.claim))]
+            self._db.executemany(
+                "UPDATE games SET status = ?, owner = ?, lease_until = ? WHERE id = ?",
+                ((RUNNING, self.name, now + self.lease_sec, game) for game in games))
+        return games
+
+    # A method that extends the leases of games and returns whether the worker
+    # still holds all of them (one may have been taken over while the worker
+    # was stalled)
+    def _renew(self, games):
+        with self._db:
+            cursor = self._db.executemany(
+                "UPDATE games SET lease_until = ? WHERE id = ? AND owner = ? AND status = ?",
+                ((time.time() + self.lease_sec, game, self.name, RUNNING) for game in games))
+        return cursor.rowcount == len(games)
+
+    def _release(self, games):
+        with self._db:
+            self._db.executemany(
+                "UPDATE games SET status = ?, owner = NULL WHERE id = ? AND owner = ?",
+                ((PENDING, game, self.name) for game in games))
+
+    def _finish(self, result, others):
+        # The result is on disk before the game is marked done; if the worker
+        # stops in between, the game is played again and its duplicate record
+        # is ignored by summarize_job
+        self._results.write(result.tobytes())
+        self._results.flush()
+        os.fsync(self._results.fileno())
+        with self._db:
+            self._db.execute("UPDATE games SET status = ? WHERE id = ? AND owner = ?",
+                             (DONE, int(result["game"]), self.name))
+            self._db.executemany(
+                "UPDATE games SET lease_until = ? WHERE id = ? AND owner = ?",
+                ((time.time() + self.lease_sec, game, self.name) for game in others))
+        path = _checkpoint_path(self.directory, int(result["game"]))
+        if os.path.exists(path):
+            os.remove(path)
+
+    # A method that plays a game from its checkpoint (or from the start) and
+    # returns its result record, or None if the worker stopped or lost the game
+    def _play(self, game):
+        job, seed = self.job, self.job.first_seed + game
+        state = _load_checkpoint(self.directory, game)
+        if state is None:
+            Tetromino.grid_height, Tetromino.grid_width = job.grid_h, job.grid_w
+            grid, pieces, rng, count = GameGrid(job.grid_h, job.grid_w), PieceStream(seed), \
+                random.Random(seed), 0
+            current, next_piece = pieces.next(), pieces.next()
+            board, score = grid.exponent_matrix(), 0
+        else:
+            saved, rng, count = state
+            grid, pieces = saved.grid, saved.pieces
+            current, next_piece = grid.current_tetromino, saved.next_piece
+            board, score = grid.exponent_matrix(), grid.score
+        win, game_over = False, False
+        last_checkpoint = time.time()
+        while count < job.max_pieces:
+            if self._stopping or time.time() - last_checkpoint >= self.checkpoint_sec:
+                # Only the worker that holds the game writes its checkpoint
+                if not self._renew([game]):
+                    return None
+                self._checkpoint(game, board, score, current, next_piece, pieces, rng, count)
+                if self._stopping:
+                    return None
+                last_checkpoint = time.time()
+            tiles = current.tile_exponents()
+            placements = enumerate_placements(board, tiles)
+            i = self.agent(board, tiles, next_piece.tile_exponents(), placements, rng)
+            board, points, game_over = play_placement(board, tiles, placements, i, grid)
+            score += points
+            win = grid.win
+            count += 1
+            if game_over or win:
+                break
+            current, next_piece = next_piece, pieces.next()
+        result = np.zeros((), RESULT_DTYPE)
+        result["game"], result["score"], result["win"] = game, score, win
+        result["max_exponent"], result["pieces"] = board.max(), count
+        return result
+
+    def _checkpoint(self, game, board, score, current, next_piece, pieces, rng, count):
+        grid = GameGrid(self.job.grid_h, self.job.grid_w)
+        grid.set_exponent_matrix(board)
+        grid.score, grid.current_tetromino = score, current
+        version, words, gauss = rng.getstate()
+        header = _CHECKPOINT.pack(_CHECKPOINT_MAGIC, _CHECKPOINT_VERSION, game, count,
+                                  *words, float("nan") if gauss is None else gauss)
+        data = header + pack_state(grid, next_piece, pieces, 0.0)
+        try:
+            write_atomically(_checkpoint_path(self.directory, game),
+                             data + _CHECKPOINT_CRC.pack(zlib.crc32(data)))
+        except OSError:
+            pass  # The game is played again from its previous checkpoint
+
+
+# A function that reads the result shards of the job in directory and returns
+# its Summary. Records of games played twice (by a worker that stopped after
+# saving the result) are counted once.
+def summarize_job(directory):
+    job = load_job(directory)
+    records = [np.fromfile(path, RESULT_DTYPE, os.path.getsize(path) // RESULT_DTYPE.itemsize)
+               for path in sorted(glob.glob(os.path.join(directory, "results", "*.t48r")))]
+    records = np.concatenate(records) if records else np.zeros(0, RESULT_DTYPE)
+    games, first = np.unique(records["game"], return_index=True)  # Sorted by game
+    records = records[first]
+    total = int(records["score"].sum())
+    wins = int(records["win"].sum())
+    count = len(records)
+    exponents, counts = np.unique(records["max_exponent"], return_counts=True)
+    return Summary(count, job.games - count, total, total / count if count else 0.0,
+                   wins, wins / count if count else 0.0,
+                   int(records["pieces"].sum()) / count if count else 0.0,
+                   {1 << int(e): int(c) for e, c in zip(exponents, counts) if e})
+
+
+# A function that runs a worker on the job in directory (used for starting
+# worker processes)
+def run_worker(directory, checkpoint_sec=60.0, lease_sec=300.0):
+    worker = Worker(directory, checkpoint_sec, lease_sec)
+    try:
+        return worker.run()
+    finally:
+        worker.close()
+
+
+def _connect(directory, check_same_thread=True):
+    db = sqlite3.connect(os.path.join(directory, "queue.sqlite"), timeout=60,
+                         isolation_level=None,  # Transactions are begun explicitly
+                         check_same_thread=check_same_thread)
+    db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value)")
+    db.execute("CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, "
+               "status INTEGER NOT NULL DEFAULT 0, owner TEXT, lease_until REAL)")
+    db.execute("CREATE INDEX IF NOT EXISTS games_by_status ON games (status, lease_until)")
+    return _Transactions(db)
+
+
+# A wrapper of a connection in autocommit mode whose "with" block is one
+# transaction (BEGIN, unless the block begins it, then COMMIT or ROLLBACK)
+class _Transactions:
+    def __init__(self, db):
+        self._db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK" if kind else "COMMIT")
+
+    def execute(self, sql, parameters=()):
+        if not self._db.in_transaction and not sql.startswith("BEGIN"):
+            self._db.execute("BEGIN")
+        return self._db.execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN")
+        return self._db.executemany(sql, parameters)
+
+    def close(self):
+        self._db.close()
+
+
+def _checkpoint_path(directory, game):
+    return os.path.join(directory, "checkpoints", "game-%08d.t48c" % game)
+
+
+# A function that returns the state saved in the checkpoint of a game as
+# (SavedGame, random.Random, pieces placed), or None if there is no usable one
+def _load_checkpoint(directory, game):
+    try:
+        with open(_checkpoint_path(directory, game), "rb") as f:
+            data = f.read()
+        data, crc = data[:-_CHECKPOINT_CRC.size], data[-_CHECKPOINT_CRC.size:]
+        if _CHECKPOINT_CRC.pack(zlib.crc32(data)) != crc:
+            return None  # Damaged
+        fields = _CHECKPOINT.unpack_from(data)
+        saved = unpack_state(data[_CHECKPOINT.size:])
+    except (OSError, struct.error, ValueError):
+        return None  # Start the game again
+    magic, version, checkpoint_game, count = fields[:4]
+    if magic != _CHECKPOINT_MAGIC or version != _CHECKPOINT_VERSION or checkpoint_game != game:
+        return None
+    gauss = fields[-1]
+    rng = random.Random()
+    rng.setstate((3, tuple(fields[4:-1]), None if gauss != gauss else gauss))
+    return saved, rng, count
+
+
+if __name__ == "__main__":
+    import argparse  # used for reading the command line options
+    import multiprocessing  # used for running workers on all cores
+    parser = argparse.ArgumentParser(
+        description="Run long batches of simulated Tetris 2048 games that can be "
+                    "stopped and resumed, on one or more nodes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="create a job")
+    create.add_argument("directory")
+    create.add_argument("--agent", default="tournament:greedy_agent")
+    create.add_argument("--games", type=int, required=True)
+    create.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    create.add_argument("--height", type=int, default=20)
+    create.add_argument("--width", type=int, default=12)
+    create.add_argument("--max-pieces", type=int, default=1000)
+    run = commands.add_parser("run", help="work on a job until it is done")
+    run.add_argument("directory")
+    run.add_argument("--processes", type=int, default=os.cpu_count())
+    run.add_argument("--checkpoint-sec", type=float, default=60.0)
+    run.add_argument("--lease-sec", type=float, default=300.0)
+    summary = commands.add_parser("summary", help="show the progress and results of a job")
+    summary.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        create_job(args.directory, args.agent, args.games, args.seed, args.height,
+                   args.width, args.max_pieces)
+    elif args.command == "run":
+        processes = [multiprocessing.Process(
+            target=run_worker, args=(args.directory, args.checkpoint_sec, args.lease_sec))
+            for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:  # The workers checkpoint their games and stop
+            for process in processes:
+                process.join()
+    else:
+        pending, running, done = job_status(args.directory)
+        print("%d games pending, %d running, %d done" % (pending, running, done))
+        print(summarize_job(args.directory))
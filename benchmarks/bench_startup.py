@@ -0,0 +1,76 @@
+"""
+Measure the cold start of the game: the time from launching a new Python
+process to the first menu frame being shown.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [--runs 10] [--backend window]
+
+Each run starts a fresh interpreter that imports Tetris_2048 and calls
+show_menu(); the run ends when the menu calls stddraw.show() for the first
+time.  Runs are made both with an empty font cache (as on the first start
+after installation) and with the cache filled by a previous run.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Program run by every measured process: it prints the time at which the
+# first menu frame is shown and exits.
+_CHILD = '''
+import asyncio, os, sys, time
+import lib.stddraw as stddraw
+def show(msec=0):
+    print(time.time())
+    sys.stdout.flush()
+    os._exit(0)
+stddraw.show = show
+import Tetris_2048
+asyncio.run(Tetris_2048.show_menu(20, 18))
+'''
+
+
+def time_to_first_frame(backend, font_cache):
+    """
+    Start the game in a new process and return the number of seconds
+    until its first menu frame is shown.
+    """
+    env = dict(os.environ, STDDRAW_BACKEND=backend,
+               STDDRAW_FONT_CACHE=font_cache)
+    start = time.time()
+    out = subprocess.run([sys.executable, '-c', _CHILD], cwd=ROOT, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                         check=True).stdout
+    return float(out.split()[-1]) - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--backend', default='window',
+                        help='stddraw backend (window, offscreen or null)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        font_cache = os.path.join(tmp, 'fonts.json')
+        cold, warm = [], []
+        for _ in range(args.runs):
+            if os.path.exists(font_cache):
+                os.remove(font_cache)
+            cold.append(time_to_first_frame(args.backend, font_cache))
+            warm.append(time_to_first_frame(args.backend, font_cache))
+
+    for name, times in (('empty font cache', cold), ('filled font cache', warm)):
+        print('%-18s min %6.1f ms   median %6.1f ms' % (
+            name, 1000 * min(times), 1000 * statistics.median(times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import glob  # used for finding the shards of a dataset
+import os  # used for the names and sizes of the shard files
+import struct  # used for the header of the shard files
+import numpy as np  # used for the records and the memory-mapped shards
+from tetromino import TETROMINO_TYPES  # piece types are stored as indices in it
+
+# A dataset is a directory of shard files named shard-00000.t48d, ... Each
+# shard is a header followed by fixed-size records, one per sample of a game:
+#   board:       the board before the piece was placed, as tile exponents
+#                (0 for an empty cell, 1 for 2, 2 for 4, ...) row by row from
+#                the bottom, packed two per byte
+#   piece_type:  index of the type of the placed piece in TETROMINO_TYPES
+#   piece_tiles: tile exponents of the piece before it was rotated, padded to
+#                4x4 and packed two per byte
+#   column:      x of the bottom-left cell of the piece when it was dropped
+#   rotation:    clockwise quarter turns made before the piece was dropped
+#   reward:      points scored by placing the piece
+#   game_over:   1 if the game ended with this placement, else 0
+# Records are read straight from the memory-mapped files, so batches of a
+# reader are NumPy views of the files that cost no copying or unpickling.
+MAGIC = b"T48D"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBBxIQ")  # magic, version, height, width, record size, count
+HEADER_SIZE = 64  # Records start at this offset, leaving room for new header fields
+SHARD_NAME = "shard-%05d.t48d"
+_PIECE_SIZE = 4  # Tile matrices of the pieces are padded to this size
+
+
+# A function that returns the NumPy dtype of the records for boards of the
+# given size
+def record_dtype(grid_h, grid_w):
+    return np.dtype([("board", np.uint8, ((grid_h * grid_w + 1) // 2,)),
+                     ("piece_type", np.uint8),
+                     ("piece_tiles", np.uint8, (_PIECE_SIZE * _PIECE_SIZE // 2,)),
+                     ("column", np.int8),
+                     ("rotation", np.uint8),
+                     ("reward", np.int32),
+                     ("game_over", np.uint8)])
+
+
+# A function that packs matrices of exponents (one matrix, or a batch of them
+# along the first axis) two per byte, as stored in the records
+def pack_exponents(exponents, shape):
+    exponents = np.asarray(exponents, dtype=np.uint8)
+    size = shape[0] * shape[1]
+    flat = exponents.reshape(-1, size)
+    if flat.size and flat.max() > 15:
+        raise ValueError("tiles above 32768 cannot be stored")
+    if size % 2:
+        flat = np.concatenate((flat, np.zeros((len(flat), 1), np.uint8)), axis=1)
+    packed = (flat[:, 0::2] << 4) | flat[:, 1::2]
+    return packed.reshape(exponents.shape[:-2] + (packed.shape[1],))
+
+
+# A function that unpacks exponents packed by pack_exponents into matrices of
+# the given shape (e.g. unpack_exponents(batch["board"], (20, 12)))
+def unpack_exponents(packed, shape):
+    packed = np.asarray(packed, dtype=np.uint8)
+    flat = np.empty(packed.shape[:-1] + (2 * packed.shape[-1],), np.uint8)
+    flat[..., 0::2], flat[..., 1::2] = packed >> 4, packed & 15
+    return flat[..., :shape[0] * shape[1]].reshape(packed.shape[:-1] + tuple(shape))
+
+
+# A class for appending samples to a dataset. A shard is preallocated for
+# records_per_shard records and filled through a memory map; when it is full,
+# the next shard is started. The number of records in a shard is written to
+# its header by flush and close, so the samples appended after the last flush
+# are lost if the program stops.
+class DatasetWriter:
+    def __init__(self, directory, grid_h, grid_w, records_per_shard=1 << 20):
+        self.directory = directory
+        self.grid_height, self.grid_width = grid_h, grid_w
+        self.records_per_shard = records_per_shard
+        self.dtype = record_dtype(grid_h, grid_w)
+        os.makedirs(directory, exist_ok=True)
+        self._shard = len(_shard_paths(directory))  # Index of the next shard
+        self._map, self._records, self._count = None, None, 0
+
+    # A method that appends one sample: the board as a matrix of exponents
+    # (e.g. GameGrid.exponent_matrix()), the piece type ("I", "O", ...) and its
+    # matrix of exponents before rotation (e.g. Tetromino.tile_exponents()),
+    # the column and rotation it was dropped with and the outcome
+    def append(self, board, piece_type, piece_tiles, column, rotation, reward,
+               game_over=False):
+        self.append_batch(np.asarray(board)[None], [piece_type],
+                          [_pad_piece(piece_tiles)], [column], [rotation],
+                          [reward], [game_over])
+
+    # A method that appends a batch of samples, given as sequences of equal
+    # length of the arguments of append (piece tiles padded to 4x4)
+    def append_batch(self, boards, piece_types, piece_tiles, columns, rotations,
+                     rewards, game_overs):
+        n = len(piece_types)
+        records = np.empty(n, self.dtype)
+        records["board"] = pack_exponents(boards, (self.grid_height, self.grid_width))
+        records["piece_type"] = [t if isinstance(t, (int, np.integer))
+                                 else TETROMINO_TYPES.index(t) for t in piece_types]
+        records["piece_tiles"] = pack_exponents(piece_tiles, (_PIECE_SIZE, _PIECE_SIZE))
+        records["column"], records["rotation"] = columns, rotations
+        records["reward"], records["game_over"] = rewards, game_overs
+        self.append_records(records)
+
+    # A method that appends an array of records of this dataset's dtype
+    def append_records(self, records):
+        start = 0
+        while start < len(records):
+            if self._map is None or self._count == self.records_per_shard:
+                self._next_shard()
+            n = min(len(records) - start, self.records_per_shard - self._count)
+            self._records[self._count:self._count + n] = records[start:start + n]
+            self._count += n
+            start += n
+
+    # A method that writes the appended records and their number to disk
+    def flush(self):
+        if self._map is not None:
+            self._map.flush()
+            self._write_header(self._count)
+
+    # A method that finishes the dataset, cutting the unused records off the
+    # last shard
+    def close(self):
+        if self._map is None:
+            return
+        self.flush()
+        path = self._path
+        self._map, self._records = None, None
+        with open(path, "r+b") as f:
+            f.truncate(HEADER_SIZE + self._count * self.dtype.itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next_shard(self):
+        self.close()
+        self._path = os.path.join(self.directory, SHARD_NAME % self._shard)
+        self._shard += 1
+        with open(self._path, "wb") as f:  # A sparse file of the full size
+            f.truncate(HEADER_SIZE + self.records_per_shard * self.dtype.itemsize)
+        self._map = np.memmap(self._path, np.uint8, "r+")
+        self._records = self._map[HEADER_SIZE:].view(self.dtype)
+        self._count = 0
+        self._write_header(0)
+
+    def _write_header(self, count):
+        self._map[:_HEADER.size] = np.frombuffer(_HEADER.pack(
+            MAGIC, VERSION, self.grid_height, self.grid_width,
+            self.dtype.itemsize, count), np.uint8)
+        self._map.flush()
+
+
+# A class for reading a dataset written by DatasetWriter. Records are indexed
+# as one array across all shards: an index gives one record, and a slice
+# within a shard gives a view of the memory-mapped file. Slices across shards
+# and arrays of indices gather copies of the records.
+class Dataset:
+    def __init__(self, directory):
+        self.shards = []  # Memory-mapped records of every shard
+        self.grid_height = self.grid_width = None
+        for path in _shard_paths(directory):
+            with open(path, "rb") as f:
+                magic, version, grid_h, grid_w, size, count = \
+                    _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(path + " is not a shard of a supported version")
+            if self.grid_height is None:
+                self.grid_height, self.grid_width = grid_h, grid_w
+                self.dtype = record_dtype(grid_h, grid_w)
+            if (grid_h, grid_w, size) != (self.grid_height, self.grid_width,
+                                          self.dtype.itemsize):
+                raise ValueError(path + " holds boards of another size")
+            if count:  # An empty shard cannot be memory-mapped
+                self.shards.append(np.memmap(path, self.dtype, "r",
+                                             HEADER_SIZE, (count,)))
+        if self.grid_height is None:
+            raise ValueError("no shards in " + directory)
+        # Index of the first record of every shard, and the total at the end
+        self._starts = np.cumsum([0] + [len(s) for s in self.shards])
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                shard = int(np.searchsorted(self._starts, start, "right")) - 1
+                if 0 <= shard < len(self.shards) and stop <= self._starts[shard + 1]:
+                    offset = self._starts[shard]
+                    return self.shards[shard][start - offset:stop - offset]
+            index = np.arange(start, stop, step)
+        if np.ndim(index) == 0:
+            index = int(index)
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("record index out of range")
+            shard = int(np.searchsorted(self._starts, index, "right")) - 1
+            return self.shards[shard][index - self._starts[shard]]
+        return self.take(index)
+
+    # A method that gathers the records at an array of indices into a new array
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + len(self), indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError("record index out of range")
+        out = np.empty(indices.shape, self.dtype)
+        shards = np.searchsorted(self._starts, indices, "right") - 1
+        for shard in np.unique(shards):
+            mask = shards == shard
+            out[mask] = self.shards[shard][indices[mask] - self._starts[shard]]
+        return out
+
+    # A method that yields the records in batches of batch_size. In order, the
+    # batches are views of the files (a batch never spans two shards, so the
+    # last batch of a shard may be smaller); shuffled, every batch is a copy of
+    # records picked at random without replacement.
+    def batches(self, batch_size, shuffle=False, seed=None):
+        if not shuffle:
+            for records in self.shards:
+                for start in range(0, len(records), batch_size):
+                    yield records[start:start + batch_size]
+            return
+        order = np.random.default_rng(seed).permutation(len(self))
+        for start in range(0, len(order), batch_size):
+            # Sorted indices read the files in order, which is much faster
+            yield self.take(np.sort(order[start:start + batch_size]))
+
+    # A method that returns batch_size records picked at random (with
+    # replacement) as a new array
+    def sample(self, batch_size, rng=None):
+        rng = np.random.default_rng() if rng is None else rng
+        return self.take(np.sort(rng.integers(0, len(self), batch_size)))
+
+    # A method that unpacks the boards of records into a batch of exponent
+    # matrices of shape (n, grid_height, grid_width)
+    def boards(self, records):
+        return unpack_exponents(records["board"], (self.grid_height, self.grid_width))
+
+    # A method that unpacks the piece tiles of records into a batch of 4x4
+    # exponent matrices
+    @staticmethod
+    def piece_tiles(records):
+        return unpack_exponents(records["piece_tiles"], (_PIECE_SIZE, _PIECE_SIZE))
+
+
+def _shard_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "shard-*.t48d")))
+
+
+def _pad_piece(tiles):
+    padded = np.zeros((_PIECE_SIZE, _PIECE_SIZE), np.uint8)
+    tiles = np.asarray(tiles)
+    padded[:tiles.shape[0], :tiles.shape[1]] = tiles
+    return padded
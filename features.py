@@ -0,0 +1,70 @@
+import numpy as np  # used for computing the features of many boards at once
+
+# Features computed by board_features, in the order of the feature vector. The
+# vector ends with the height of every column, from left to right.
+#   aggregate_height: sum of the column heights
+#   max_height:       height of the highest column
+#   holes:            empty cells with a tile somewhere above them
+#   bumpiness:        sum of the height differences of neighboring columns
+#   adjacent_equal:   pairs of side-by-side or stacked tiles with equal numbers
+#   max_exponent:     exponent of the largest tile (11 for 2048)
+#   max_row, max_col: position of the largest tile (the lowest, then leftmost
+#                     one if there are several)
+FEATURE_NAMES = ("aggregate_height", "max_height", "holes", "bumpiness",
+                 "adjacent_equal", "max_exponent", "max_row", "max_col")
+
+
+# A function that returns the names of the features of boards with grid_w
+# columns, i.e. FEATURE_NAMES followed by one name per column height
+def feature_names(grid_w):
+    return FEATURE_NAMES + tuple("height_%d" % x for x in range(grid_w))
+
+
+# A function that returns the height of every column of a board, or of a batch
+# of boards along the first axis. Boards are matrices of tile exponents as
+# returned by GameGrid.exponent_matrix (0 for an empty cell, row 0 at the
+# bottom); the height of a column is 1 + the row of its highest tile.
+def column_heights(boards):
+    occupied = np.asarray(boards) != 0
+    grid_h = occupied.shape[-2]
+    top_down = occupied[..., ::-1, :]
+    return np.where(occupied.any(axis=-2),
+                    grid_h - top_down.argmax(axis=-2), 0).astype(np.int32)
+
+
+# A function that returns the feature vector of a board, or a matrix with the
+# feature vector of every board of a batch along the first axis (see
+# feature_names for the order). Boards are matrices of tile exponents as taken
+# by column_heights. All boards are processed together with array operations,
+# so scoring e.g. every placement of a piece is one call on a batch.
+def board_features(boards):
+    boards = np.asarray(boards)
+    single = boards.ndim == 2
+    if single:
+        boards = boards[None]
+    n, grid_h, grid_w = boards.shape
+    occupied = boards != 0
+    heights = column_heights(boards)
+
+    features = np.empty((n, len(FEATURE_NAMES) + grid_w), dtype=np.int32)
+    features[:, 0] = heights.sum(axis=1)
+    features[:, 1] = heights.max(axis=1)
+    # Every tile is below the height of its column, so the cells below the
+    # heights that are not tiles are the holes
+    features[:, 2] = features[:, 0] - occupied.sum(axis=(1, 2))
+    features[:, 3] = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+    stacked = (boards[:, 1:, :] == boards[:, :-1, :]) & occupied[:, 1:, :]
+    side_by_side = (boards[:, :, 1:] == boards[:, :, :-1]) & occupied[:, :, 1:]
+    features[:, 4] = stacked.sum(axis=(1, 2)) + side_by_side.sum(axis=(1, 2))
+    largest = boards.reshape(n, -1).argmax(axis=1)
+    features[:, 5] = boards.reshape(n, -1)[np.arange(n), largest]
+    features[:, 6], features[:, 7] = np.divmod(largest, grid_w)
+    features[:, len(FEATURE_NAMES):] = heights
+    return features[0] if single else features
+
+
+# A function that scores boards with a linear evaluator: the dot product of
+# their feature vectors with weights (one weight per feature, in the order of
+# feature_names). Returns one score, or a vector of scores for a batch.
+def linear_evaluation(boards, weights):
+    return board_features(boards) @ np.asarray(weights, dtype=np.float64)
@@ -2,12 +2,56 @@ import lib.stddraw as stddraw
 # Import stddraw for drawing graphics on the screen.
 from lib.color import Color
 # Import the Color class to define colors for tiles and backgrounds.
-from point import Point
-# Point class is used to manage positions (x, y) cleanly.
+from tile import Tile
+# Tile class is used to draw all the locked tiles in one batch.
 import numpy as np
 # numpy (np) is imported to manage efficient 2D arrays.
 import copy as cp
 # copy (cp) is imported to duplicate objects if necessary.
+import functools
+# functools is imported for the bounded cache of merges of long stacks.
+from grid_events import Placement, Merge, TileMoved, RowCleared, ScoreChanged, Win, GameOver
+# The events a grid sends to its listeners while it resolves a lock.
+
+
+SHORT_STACK = 4
+# Stacks of up to this many tiles are memoized in a table without a size limit, since
+# there are few of them; longer stacks go through a bounded LRU cache.
+_short_stack_merges = {}
+
+
+def _merge_stack(numbers):
+# A function that merges a contiguous stack of tiles in a column, given as the tuple of
+# their numbers from the bottom up, the way one pass of GameGrid._cascade_merge does.
+# It returns the offsets of the tiles that double (the tile above each one is removed),
+# the points scored and whether a 2048 tile was made.
+    merges, score, win = [], 0, False
+    i = 0
+    while i < len(numbers) - 1:
+        if numbers[i] == numbers[i + 1]:
+            merges.append(i)
+            score += 2 * numbers[i]
+            win = win or 2 * numbers[i] == 2048
+            i += 2
+            # The doubled tile has an empty cell above it, so scanning resumes two cells up.
+        else:
+            i += 1
+    return tuple(merges), score, win
+
+
+_merge_long_stack = functools.lru_cache(maxsize=4096)(_merge_stack)
+# Merges of stacks longer than SHORT_STACK, of which only the most recent are kept.
+
+
+def merge_stack(numbers):
+# A function that returns _merge_stack(numbers), looked up in a table if it was computed before.
+    if len(numbers) > SHORT_STACK:
+        return _merge_long_stack(numbers)
+    result = _short_stack_merges.get(numbers)
+    if result is None:
+        result = _short_stack_merges[numbers] = _merge_stack(numbers)
+    return result
+
 
 class GameGrid:
 # We define the GameGrid class, which will manage the entire game board, the tiles, and game logic like merging and clearing rows.
@@ -33,9 +77,58 @@ class GameGrid:
         # Set visual thickness settings for drawing.
         self.win = False
         # A flag to indicate if the player has reached the 2048 tile.
+        self._cell_coords = tuple((col, row) for row in range(grid_h)
+                                  for col in range(grid_w))
+        # The (x, y) position of every cell in the order of tile_matrix.flat, computed once.
+        self._drawn_tiles, self._drawn_xs, self._drawn_ys = [], [], []
+        # Lists reused by every draw_grid call to collect the occupied cells.
+        start_x, end_x = -0.5, grid_w - 0.5
+        start_y, end_y = -0.5, grid_h - 0.5
+        xs = np.arange(start_x + 1, end_x, 1)
+        ys = np.arange(start_y + 1, end_y, 1)
+        self._grid_lines = (
+            np.concatenate((xs, np.full(len(ys), start_x))),
+            np.concatenate((np.full(len(xs), start_y), ys)),
+            np.concatenate((xs, np.full(len(ys), end_x))),
+            np.concatenate((np.full(len(xs), end_y), ys)))
+        # Endpoints (x0, y0, x1, y1) of the vertical then horizontal inner grid lines.
+        self._listeners = []
+        # Functions called with the events of every lock (see add_listener).
+        self._events = None
+        # Events of the lock being resolved, or None when nobody listens so that no events are made.
+
+    def add_listener(self, listener):
+    # A method that makes the grid call listener(events) after every lock, with the list of the
+    # grid_events records of that lock in the order they happened.
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+    # A method that stops calling a listener added with add_listener.
+        self._listeners.remove(listener)
+
+    def _send_events(self):
+    # A method that sends the events of the lock that was resolved to every listener.
+        events, self._events = self._events, None
+        if events is not None:
+            for listener in list(self._listeners):
+                listener(events)
 
     def update_grid(self, tiles_to_lock, blc_pos):
     # This method locks the tiles from a Tetromino into the game board once it lands.
+        for _ in self.resolve_lock(tiles_to_lock, blc_pos):
+            pass
+        # Run every step of the lock at once.
+        return self.game_over
+        # Return whether the game ended.
+
+    def resolve_lock(self, tiles_to_lock, blc_pos):
+    # A generator that locks the tiles from a Tetromino into the game board one step at a time.
+    # It yields the name of each step ("lock", "merge", "fall" or "clear") right after the
+    # board changed, so the caller can draw every intermediate board and spread a long chain
+    # reaction over several frames; the lock is resolved when the generator is exhausted.
+        events = self._events = [] if self._listeners else None
+        placed = []
+        # The events of the lock are only collected if somebody listens.
         for r in range(len(tiles_to_lock)):
             for c in range(len(tiles_to_lock[0])):
             # Iterate over each tile inside the falling Tetromino.
@@ -48,55 +141,89 @@ class GameGrid:
                 # Calculate the position of each tile relative to the main grid.
                 if y >= self.grid_height:
                     self.game_over = True
-                    return True
+                    if events is not None:
+                        events += [Placement(tuple(placed)), GameOver()]
+                        self._send_events()
+                    return
                 # If the tile tries to go above the top, it’s game over.
                 self.tile_matrix[y][x] = tile
                 # Otherwise, place the tile into the main grid.
+                if events is not None:
+                    placed.append((x, y, tile.number))
+        if events is not None:
+            events.append(Placement(tuple(placed)))
+        yield "lock"
 
         # Now, one by one we use the methods below to
-        self._cascade_merge()
+        yield from self._cascade_merge_steps()
         # Merge identical tiles vertically.
-        self._settle_floating()
+        yield from self._settle_steps()
         # Settle floating tiles downward.
-        self._clear_rows()
+        if self._clear_rows():
+            yield "clear"
         # Clear any full rows.
-        self._settle_floating()
+        yield from self._settle_steps()
         # Settle again in case clearing created new floating tiles.
-
-        return self.game_over
-        # Return whether the game ended.
+        self._send_events()
 
     def _cascade_merge(self):
     # Merge identical tiles vertically over and over until no more merges are possible.
+        for _ in self._cascade_merge_steps():
+            pass
+
+    def _cascade_merge_steps(self):
+    # A generator that merges identical tiles vertically, yielding after every pass that merged
+    # tiles and every row the tiles fall afterwards.
+        events = self._events
         merged = True
         while merged:
         # Keep looping until no merges happen.
             merged = False
             for x in range(self.grid_width):
+                column = self.tile_matrix[:, x]
                 y = 0
-                while y < self.grid_height - 1:
-                # Scan the grid bottom-up, column-by-column.
-                    t1 = self.tile_matrix[y][x]
-                    t2 = self.tile_matrix[y + 1][x]
-                    # t1 is the tile above, t2 is below.
-                    if t1 and t2 and t1.number == t2.number:
-                    # If both tiles exist and have the same number:
-                        t1.double()
-                        self.score += t1.number
-                        if t1.number == 2048:
-                            self.win = True
-                        self.tile_matrix[y + 1][x] = None
-                        merged = True
-                        # Double the tile value, add to score, mark win if 2048 is reached, delete the lower tile, and keep merging.
-                    else:
+                while y < self.grid_height:
+                # Scan the column bottom-up for contiguous stacks of tiles.
+                    if column[y] is None:
+                        y += 1
+                        continue
+                    start = y
+                    while y < self.grid_height and column[y] is not None:
                         y += 1
-                    # Move upward if no merge.
+                    if y - start < 2:
+                        continue
+                    # A single tile has nothing to merge with.
+                    merges, score, win = merge_stack(tuple(t.number for t in column[start:y]))
+                    # Merges in a stack only depend on its numbers, so they are looked up.
+                    for i in merges:
+                        column[start + i].double()
+                        column[start + i + 1] = None
+                        # Double the lower tile of each merged pair and delete the upper one.
+                        if events is not None:
+                            events.append(Merge(x, start + i, column[start + i].number))
+                    if merges:
+                        self.score += score
+                        if events is not None:
+                            events.append(ScoreChanged(score, self.score))
+                            if win and not self.win:
+                                events.append(Win())
+                        self.win = self.win or win
+                        merged = True
+                        # Add to score, mark win if 2048 is reached, and keep merging.
             if merged:
-                self._settle_floating()
+                yield "merge"
+                yield from self._settle_steps()
             # If anything merged, settle again.
-            
+
     def _settle_floating(self):
     # This method makes unsupported tiles fall downward until they land.
+        for _ in self._settle_steps():
+            pass
+
+    def _settle_steps(self):
+    # A generator that makes unsupported tiles fall downward one row at a time, yielding after
+    # every row until they land.
+        events = self._events
         while True:
             connected = self._connected_to_bottom()
             moved = False
@@ -112,11 +239,14 @@ class GameGrid:
                         self.tile_matrix[y - 1][x] = tile
                         self.tile_matrix[y][x] = None
                         moved = True
+                        if events is not None:
+                            events.append(TileMoved(x, y, x, y - 1, tile.number))
                     # If below is empty, move the tile down by one.
             if not moved:
                 break
             # Stop when no more tiles fall.
-            
+            yield "fall"
+
     def _connected_to_bottom(self):
     # This method finds which tiles are supported by the ground or through a chain of connected tiles.
         visited = np.full(self.tile_matrix.shape, False)
@@ -163,12 +293,19 @@ class GameGrid:
                     self.tile_matrix[y][x] = None
         # And for any tile not visited that is floating, we delete it and add its number to the score
 
-    # clear any row that’s completely filled
+    # clear any row that’s completely filled, and return whether any was
     def _clear_rows(self):
+        events = self._events
         write_row = 0
         for read_row in range(self.grid_height):
             if None not in self.tile_matrix[read_row]:
-                self.score += sum(tile.number for tile in self.tile_matrix[read_row])
+                points = sum(tile.number for tile in self.tile_matrix[read_row])
+                self.score += points
+                if events is not None:
+                    # The row is reported where it is once the rows cleared below it
+                    # are gone, so the events can be replayed one after another
+                    events += [RowCleared(write_row, tuple(tile.number for tile in self.tile_matrix[read_row])),
+                               ScoreChanged(points, self.score)]
                 continue
             if write_row != read_row:
                 self.tile_matrix[write_row] = self.tile_matrix[read_row]
@@ -177,6 +314,7 @@ class GameGrid:
         # blank the rows that were cleared
         for y in range(write_row, self.grid_height):
             self.tile_matrix[y] = np.full(self.grid_width, None)
+        return write_row < self.grid_height
 
     def display(self):
     # A method to draw everything, which includes background, grid, tetromino, and boundaries.
@@ -189,18 +327,19 @@ class GameGrid:
 
     def draw_grid(self):
     # A method to draw each tile and grid lines.
-        for row in range(self.grid_height):
-            for col in range(self.grid_width):
-                if self.tile_matrix[row][col] is not None:
-                    self.tile_matrix[row][col].draw(Point(col, row))
+        tiles, xs, ys = self._drawn_tiles, self._drawn_xs, self._drawn_ys
+        tiles.clear(); xs.clear(); ys.clear()
+        for (col, row), tile in zip(self._cell_coords, self.tile_matrix.flat):
+            if tile is not None:
+                tiles.append(tile)
+                xs.append(col)
+                ys.append(row)
+        # Collect the occupied cells without building a Point for each one.
+        Tile.draw_tiles(tiles, xs, ys)
         stddraw.setPenColor(self.line_color)
         stddraw.setPenRadius(self.line_thickness)
-        start_x, end_x = -0.5, self.grid_width - 0.5
-        start_y, end_y = -0.5, self.grid_height - 0.5
-        for x in np.arange(start_x + 1, end_x, 1):
-            stddraw.line(x, start_y, x, end_y)
-        for y in np.arange(start_y + 1, end_y, 1):
-            stddraw.line(start_x, y, end_x, y)
+        stddraw.lines(*self._grid_lines)
+        # Draw all the inner grid lines with one call.
         stddraw.setPenRadius()
 
     def draw_boundaries(self):
@@ -210,6 +349,19 @@ class GameGrid:
         stddraw.rectangle(-0.5, -0.5, self.grid_width, self.grid_height)
         stddraw.setPenRadius()
 
+    def exponent_matrix(self):
+    # A method that returns the grid as a matrix of tile exponents (0 for an empty cell, 1 for 2, 2 for 4, ...).
+        exponents = np.zeros((self.grid_height, self.grid_width), dtype=np.uint8)
+        for (col, row), tile in zip(self._cell_coords, self.tile_matrix.flat):
+            if tile is not None:
+                exponents[row, col] = tile.number.bit_length() - 1
+        return exponents
+
+    def set_exponent_matrix(self, exponents):
+    # A method that replaces every tile of the grid with the tiles of a matrix of exponents.
+        for (col, row), exp in zip(self._cell_coords, exponents.flat):
+            self.tile_matrix[row][col] = Tile(1 << int(exp)) if exp else None
+
     def is_occupied(self, row, col):
     # A method to check if a specific grid cell is occupied.
         if not self.is_inside(row, col):
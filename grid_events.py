@@ -0,0 +1,24 @@
+import collections  # used for the event records
+
+# Events emitted by a GameGrid while it resolves a lock (see
+# GameGrid.add_listener). Positions are (x, y) cells of the grid with y = 0 at
+# the bottom, and numbers are tile numbers (2, 4, 8, ...).
+
+# The tiles of a piece were locked into the grid: a tuple of (x, y, number)
+Placement = collections.namedtuple("Placement", ["tiles"])
+# Two stacked tiles merged into the tile at (x, y), which now has number
+Merge = collections.namedtuple("Merge", ["x", "y", "number"])
+# An unsupported tile fell from (from_x, from_y) to (to_x, to_y)
+TileMoved = collections.namedtuple(
+    "TileMoved", ["from_x", "from_y", "to_x", "to_y", "number"])
+# Row y was full and was cleared; numbers are its tiles from left to right
+# (rows above it move down by one, which is not reported as TileMoved). y is
+# the index of the row after the rows cleared before it, lower in the same
+# lock, were removed: removing rows in the order of the events gives the grid.
+RowCleared = collections.namedtuple("RowCleared", ["y", "numbers"])
+# The score changed by delta and is now score
+ScoreChanged = collections.namedtuple("ScoreChanged", ["delta", "score"])
+# A 2048 tile was made for the first time
+Win = collections.namedtuple("Win", [])
+# The locked piece did not fit in the grid and the game is over
+GameOver = collections.namedtuple("GameOver", [])
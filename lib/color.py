@@ -9,19 +9,56 @@ objects.
 
 class Color:
     """
-    A Color object models an RGB color.
+    A Color object models an RGB color.  Color objects are immutable
+    and interned: constructing two Color objects with the same
+    components yields the same object.
     """
 
+    __slots__ = ('_r', '_g', '_b', '_rgb')
+
+    # Maps each (r, g, b) triple to its one Color object.
+    _interned = {}
+
     #-------------------------------------------------------------------
 
-    def __init__(self, r=0, g=0, b=0):
+    def __new__(cls, r=0, g=0, b=0):
         """
-        Construct self such that it has the given red (r),
-        green (g), and blue (b) components.
+        Return the Color object that has the given red (r), green (g),
+        and blue (b) components, constructing it on first use.
         """
-        self._r = r  # Red component
-        self._g = g  # Green component
-        self._b = b  # Blue component
+        rgb = (r, g, b)
+        self = cls._interned.get(rgb)
+        if self is None:
+            self = object.__new__(cls)
+            object.__setattr__(self, '_r', r)  # Red component
+            object.__setattr__(self, '_g', g)  # Green component
+            object.__setattr__(self, '_b', b)  # Blue component
+            # pygame accepts an (r, g, b) tuple wherever it takes a
+            # color, so this tuple is handed to it as is.
+            object.__setattr__(self, '_rgb', rgb)
+            cls._interned[rgb] = self
+        return self
+
+    #-------------------------------------------------------------------
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Color objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Color objects are immutable')
+
+    #-------------------------------------------------------------------
+
+    def __reduce__(self):
+        # Unpickling goes through __new__, so it yields the interned
+        # object too.
+        return (Color, self._rgb)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     #-------------------------------------------------------------------
 
@@ -49,6 +86,14 @@ class Color:
 
     #-------------------------------------------------------------------
 
+    def getRGB(self):
+        """
+        Return the (r, g, b) tuple of the components of self.
+        """
+        return self._rgb
+
+    #-------------------------------------------------------------------
+
     def __str__(self):
         """
         Return the string equivalent of self, that is, a
@@ -104,6 +149,7 @@ def _main():
     print(c1.getRed())
     print(c1.getGreen())
     print(c1.getBlue())
+    print(c1 is Color(0, 128, 255))
 
 if __name__ == '__main__':
     _main()
\ No newline at end of file
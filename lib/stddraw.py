@@ -10,15 +10,18 @@ commonly used Color objects defined in the color module.
 import time
 import os
 import sys
+import collections
+import queue
+import json
+import threading
+import atexit
+
+import numpy
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
 import pygame
 import pygame.gfxdraw
 import pygame.font
-
-import tkinter as Tkinter
-import tkinter.messagebox as tkMessageBox
-import tkinter.filedialog as tkFileDialog
 	
 #-----------------------------------------------------------------------
 
@@ -95,7 +98,18 @@ _canvasWidth = float(_DEFAULT_CANVAS_SIZE)
 _canvasHeight = float(_DEFAULT_CANVAS_SIZE)
 _penRadius = None
 _penColor = _DEFAULT_PEN_COLOR
-_keysTyped = []
+_penRGB = _DEFAULT_PEN_COLOR.getRGB()  # _penColor as pygame takes it
+
+# Queue of the key events the user generated, oldest first.  Each entry
+# is a KeyEvent whose kind is KEY_DOWN or KEY_UP and whose time is the
+# time.time() at which the event was received.
+KEY_DOWN = 'down'
+KEY_UP = 'up'
+KeyEvent = collections.namedtuple('KeyEvent', ['kind', 'key', 'time'])
+_keyEvents = collections.deque()
+
+# Names of the keys that are currently held down.
+_keysDown = set()
 
 # Has the window been created?
 _windowCreated = False
@@ -120,13 +134,10 @@ _mousePos = None
 
 def _pygameColor(c):
     """
-    Convert c, an object of type color.Color, to an equivalent object
-    of type pygame.Color.  Return the result.
+    Convert c, an object of type color.Color, to an equivalent color
+    that pygame accepts.  Return the result.
     """
-    r = c.getRed()
-    g = c.getGreen()
-    b = c.getBlue()
-    return pygame.Color(r, g, b)
+    return c.getRGB()
 
 #-----------------------------------------------------------------------
 
@@ -160,13 +171,186 @@ def _userY(y):
     
 #-----------------------------------------------------------------------
 
+# Rendering backends.  Drawing functions always draw on the background
+# canvas, a pygame.Surface; the backend creates that canvas, decides
+# what show() does with it, and supplies the events.  A backend is
+# chosen with setBackend() or the STDDRAW_BACKEND environment variable
+# before the canvas is created.
+
+class Backend:
+    """
+    The interface that stddraw expects of a rendering backend.
+    """
+
+    def createCanvas(self, w, h):
+        """
+        Return the pygame.Surface, w pixels wide and h pixels high,
+        that the drawing functions will draw on.
+        """
+        return pygame.Surface((w, h))
+
+    def show(self, canvas):
+        """
+        Present canvas, which holds a completed frame.
+        """
+
+    def getEvents(self):
+        """
+        Remove all pending pygame events and return them.
+        """
+        raise NotImplementedError()
+
+    def waitEvent(self, timeout):
+        """
+        Wait up to timeout milliseconds (forever if timeout is 0) for a
+        pygame event.  Remove it and return it, or return an event of
+        type pygame.NOEVENT if none arrived.
+        """
+        raise NotImplementedError()
+
+    def postEvent(self, event):
+        """
+        Add the pygame event event to the pending events.  It may be
+        called from any thread.
+        """
+        raise NotImplementedError()
+
+class WindowBackend(Backend):
+    """
+    Shows the canvas in a pygame window and reads the user's input
+    from it.  This is the default backend.
+    """
+
+    def createCanvas(self, w, h):
+        self._window = pygame.display.set_mode([w, h])
+        pygame.display.set_caption('stddraw window (r-click to save)')
+        return pygame.Surface((w, h))
+
+    def show(self, canvas):
+        self._window.blit(canvas, (0, 0))
+        pygame.display.flip()
+
+    def getEvents(self):
+        return pygame.event.get()
+
+    def waitEvent(self, timeout):
+        return pygame.event.wait(timeout)
+
+    def postEvent(self, event):
+        pygame.event.post(event)
+
+class _HeadlessBackend(Backend):
+    """
+    A backend without a window, whose only events are the ones that
+    were posted to it.
+    """
+
+    def __init__(self):
+        self._events = queue.Queue()
+
+    def getEvents(self):
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def waitEvent(self, timeout):
+        try:
+            return self._events.get(timeout=timeout / 1000.0 or None)
+        except queue.Empty:
+            return pygame.event.Event(pygame.NOEVENT)
+
+    def postEvent(self, event):
+        self._events.put(event)
+
+class OffscreenBackend(_HeadlessBackend):
+    """
+    Renders into a NumPy array of shape (h, w, 3) holding the RGB
+    values of the canvas.  The canvas shares its memory with the
+    array, so the array is never copied and always reflects what has
+    been drawn; getFrame() returns it.
+    """
+
+    def createCanvas(self, w, h):
+        self.frame = numpy.zeros((h, w, 3), dtype=numpy.uint8)
+        return pygame.image.frombuffer(self.frame, (w, h), 'RGB')
+
+class NullBackend(_HeadlessBackend):
+    """
+    Turns every drawing function into a no-op, so that the time spent
+    in a program can be measured without its drawing.  show() still
+    waits as long as it is asked to.
+    """
+
+_BACKENDS = {
+    'window': WindowBackend,
+    'offscreen': OffscreenBackend,
+    'null': NullBackend,
+}
+
+# The drawing functions that the null backend turns into no-ops.
+_DRAWING_FUNCTIONS = (
+    'point', 'line', 'circle', 'filledCircle', 'rectangle',
+    'filledRectangle', 'square', 'filledSquare', 'polygon',
+    'filledPolygon', 'text', 'boldText', 'picture', 'clear',
+    'lines', 'squares', 'filledSquares', 'texts')
+_drawingFunctions = {}  # The real drawing functions, filled in at import
+
+def _noDrawing(*args, **kwargs):
+    pass
+
+def setBackend(backend='window'):
+    """
+    Set the rendering backend to backend, which is 'window' (a pygame
+    window), 'offscreen' (a NumPy frame buffer), 'null' (no drawing at
+    all), or an object of a subclass of Backend.  Calling this function
+    is optional. If you call it, you must do so before calling any
+    drawing function.
+    """
+    global _backend
+    if _windowCreated:
+        raise Exception('The stddraw window already was created')
+    if isinstance(backend, str):
+        if backend not in _BACKENDS:
+            raise Exception('Unknown backend: ' + backend)
+        backend = _BACKENDS[backend]()
+    _backend = backend
+    noDrawing = isinstance(backend, NullBackend)
+    for name in _DRAWING_FUNCTIONS:
+        globals()[name] = _noDrawing if noDrawing else _drawingFunctions[name]
+
+def getFrame():
+    """
+    Return the NumPy array of shape (h, w, 3) that holds the RGB values
+    of the canvas if the backend is 'offscreen', and None otherwise.
+    The same array is returned for every frame.
+    """
+    _makeSureWindowCreated()
+    return getattr(_backend, 'frame', None)
+
+# The pygame event type of the events that postKeyEvent() posts.
+_POSTED_KEY = pygame.USEREVENT
+
+def postKeyEvent(kind, key):
+    """
+    Add to the key event queue, as if the user generated it, a key
+    event of the given kind (KEY_DOWN or KEY_UP) for the key named key.
+    This is how input reaches programs that run without a window.  It
+    may be called from any thread.
+    """
+    _makeSureWindowCreated()
+    _backend.postEvent(pygame.event.Event(_POSTED_KEY, kind=kind, key=key))
+
+#-----------------------------------------------------------------------
+
 def setCanvasSize(w=_DEFAULT_CANVAS_SIZE, h=_DEFAULT_CANVAS_SIZE):
     """
     Set the size of the canvas to w pixels wide and h pixels high.
     Calling this function is optional. If you call it, you must do
     so before calling any drawing function.
     """
-    global _background
     global _surface
     global _canvasWidth
     global _canvasHeight
@@ -180,9 +364,7 @@ def setCanvasSize(w=_DEFAULT_CANVAS_SIZE, h=_DEFAULT_CANVAS_SIZE):
 
     _canvasWidth = w
     _canvasHeight = h
-    _background = pygame.display.set_mode([w, h])
-    pygame.display.set_caption('stddraw window (r-click to save)')
-    _surface = pygame.Surface((w, h))
+    _surface = _backend.createCanvas(w, h)
     _surface.fill(_pygameColor(WHITE))
     _windowCreated = True
 
@@ -235,7 +417,9 @@ def setPenColor(c=_DEFAULT_PEN_COLOR):
     c defaults to stddraw.BLACK.
     """
     global _penColor
+    global _penRGB
     _penColor = c
+    _penRGB = _pygameColor(c)
 
 def setFontFamily(f=_DEFAULT_FONT_FAMILY):
     """
@@ -261,6 +445,68 @@ def _makeSureWindowCreated():
 
 #-----------------------------------------------------------------------
 
+# Fonts.  Finding a system font by name makes pygame scan the installed
+# fonts (on Linux by running fc-list), which is slow.  So the file found
+# for each font family is remembered in a cache file that later runs
+# read instead of scanning again, and each Font object is created once.
+# Delete the cache file to look the fonts up again.
+
+_FONT_CACHE_FILE = os.environ.get(
+    'STDDRAW_FONT_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'stddraw_fonts.json'))
+
+_fontFiles = None  # (family, bold) -> (file or None, synthetic bold)
+_fonts = {}        # (family, size, bold) -> pygame.font.Font
+
+def _fontFile(family, bold):
+    """
+    Return a pair whose first element is the name of the file of the
+    font family family (bold if bold is True), or None for the pygame
+    default font, and whose second element is True if the font must
+    be made bold by pygame.
+    """
+    global _fontFiles
+    if _fontFiles is None:
+        _fontFiles = {}
+        try:
+            with open(_FONT_CACHE_FILE) as f:
+                for fam, b, path, synthetic in json.load(f):
+                    if (path is None) or os.path.exists(path):
+                        _fontFiles[(fam, b)] = (path, synthetic)
+        except (OSError, ValueError):
+            pass
+    key = (family, bool(bold))
+    if key not in _fontFiles:
+        # SysFont hands the file it found to constructor.
+        _fontFiles[key] = pygame.font.SysFont(
+            family, _fontSize, bold,
+            constructor=lambda path, size, setBold, setItalic:
+                (path, setBold))
+        try:
+            os.makedirs(os.path.dirname(_FONT_CACHE_FILE), exist_ok=True)
+            with open(_FONT_CACHE_FILE, 'w') as f:
+                json.dump([[fam, b, path, synthetic] for (fam, b),
+                           (path, synthetic) in _fontFiles.items()], f)
+        except OSError:
+            pass
+    return _fontFiles[key]
+
+def _font(bold=False):
+    """
+    Return the pygame.font.Font of the current font family and size,
+    bold if bold is True.
+    """
+    key = (_fontFamily, _fontSize, bold)
+    font = _fonts.get(key)
+    if font is None:
+        path, synthetic = _fontFile(_fontFamily, bold)
+        font = pygame.font.Font(path, _fontSize)
+        font.set_bold(synthetic)
+        _fonts[key] = font
+    return font
+
+#-----------------------------------------------------------------------
+
 # Functions to draw shapes, text, and images on the background canvas.
 
 def _pixel(x, y):
@@ -274,7 +520,7 @@ def _pixel(x, y):
         _surface,
         int(round(xs)),
         int(round(xy)),
-        _pygameColor(_penColor))
+        _penRGB)
 
 def point(x, y):
     """
@@ -291,7 +537,7 @@ def point(x, y):
         ys = _scaleY(y)
         pygame.draw.ellipse(
             _surface,
-            _pygameColor(_penColor),
+            _penRGB,
             pygame.Rect(
                 xs-_penRadius,
                 ys-_penRadius,
@@ -319,7 +565,7 @@ def line(x0, y0, x1, y1):
     y1s = _scaleY(y1)
     pygame.draw.line(
        _surface,
-       _pygameColor(_penColor),
+       _penRGB,
        (x0s, y0s),
        (x1s, y1s),
        int(round(lineWidth)))
@@ -343,7 +589,7 @@ def circle(x, y, r):
         ys = _scaleY(y)
         pygame.draw.ellipse(
             _surface,
-            _pygameColor(_penColor),
+            _penRGB,
             pygame.Rect(xs-ws/2.0, ys-hs/2.0, ws, hs),
             int(round(_penRadius)))
 
@@ -366,7 +612,7 @@ def filledCircle(x, y, r):
         ys = _scaleY(y)
         pygame.draw.ellipse(
             _surface,
-            _pygameColor(_penColor),
+            _penRGB,
             pygame.Rect(xs-ws/2.0, ys-hs/2.0, ws, hs),
             0)
 
@@ -391,7 +637,7 @@ def rectangle(x, y, w, h):
         ys = _scaleY(y)
         pygame.draw.rect(
             _surface,
-            _pygameColor(_penColor),
+            _penRGB,
             pygame.Rect(xs, ys-hs, ws, hs),
             int(round(_penRadius)))
 
@@ -416,7 +662,7 @@ def filledRectangle(x, y, w, h):
         ys = _scaleY(y)
         pygame.draw.rect(
             _surface,
-            _pygameColor(_penColor),
+            _penRGB,
             pygame.Rect(xs, ys-hs, ws, hs),
             0)
 
@@ -456,7 +702,7 @@ def polygon(x, y):
     points.append((xScaled[0], yScaled[0]))
     pygame.draw.polygon(
         _surface,
-        _pygameColor(_penColor),
+        _penRGB,
         points,
         int(round(_penRadius)))
 
@@ -478,7 +724,7 @@ def filledPolygon(x, y):
     for i in range(len(x)):
         points.append((xScaled[i], yScaled[i]))
     points.append((xScaled[0], yScaled[0]))
-    pygame.draw.polygon(_surface, _pygameColor(_penColor), points, 0)
+    pygame.draw.polygon(_surface, _penRGB, points, 0)
 
 def text(x, y, s):
     """
@@ -489,8 +735,8 @@ def text(x, y, s):
     y = float(y)
     xs = _scaleX(x)
     ys = _scaleY(y)
-    font = pygame.font.SysFont(_fontFamily, _fontSize)
-    text = font.render(s, 1, _pygameColor(_penColor))
+    font = _font()
+    text = font.render(s, 1, _penRGB)
     textpos = text.get_rect(center=(xs, ys))
     _surface.blit(text, textpos)
 
@@ -503,8 +749,8 @@ def boldText(x, y, s):
     y = float(y)
     xs = _scaleX(x)
     ys = _scaleY(y)
-    font = pygame.font.SysFont(_fontFamily, _fontSize, True)
-    text = font.render(s, 1, _pygameColor(_penColor))
+    font = _font(True)
+    text = font.render(s, 1, _penRGB)
     textpos = text.get_rect(center=(xs, ys))
     _surface.blit(text, textpos)
 
@@ -558,12 +804,109 @@ def save(f):
 
 #-----------------------------------------------------------------------
 
+# Functions to draw many shapes or strings in one call.  The coordinates
+# may be NumPy arrays or any sequences of numbers (a single number is
+# used for every shape); they are scaled to pixels in one vectorized
+# step, and then the pygame calls are issued in a tight loop.
+
+def _scaleXs(x):
+    return _scaleX(numpy.asarray(x, dtype=float))
+
+def _scaleYs(y):
+    return _scaleY(numpy.asarray(y, dtype=float))
+
+def lines(x0, y0, x1, y1):
+    """
+    Draw on the background canvas the lines from (x0[i], y0[i]) to
+    (x1[i], y1[i]).
+    """
+    _makeSureWindowCreated()
+    x0s, y0s, x1s, y1s = numpy.broadcast_arrays(
+        _scaleXs(x0), _scaleYs(y0), _scaleXs(x1), _scaleYs(y1))
+    lineWidth = _penRadius
+    if lineWidth == 0.0: lineWidth = 1.0
+    lineWidth = int(round(lineWidth))
+    drawLine = pygame.draw.line
+    for x0s, y0s, x1s, y1s in zip(x0s.tolist(), y0s.tolist(),
+                                  x1s.tolist(), y1s.tolist()):
+        drawLine(_surface, _penRGB, (x0s, y0s), (x1s, y1s), lineWidth)
+
+def _squares(x, y, r, colors, width):
+    """
+    Draw on the background canvas the squares whose sides are of length
+    2r, centered on (x[i], y[i]), with outlines width pixels wide (or
+    filled if width is 0), in colors[i] or else in the pen color.
+    """
+    _makeSureWindowCreated()
+    r = float(r)
+    ws = _factorX(2.0*r)
+    hs = _factorY(2.0*r)
+    # If the squares are too small, then simply draw pixels.
+    # The pixels are at (x-r, y-r), where filledRectangle puts them, and
+    # the pen color is restored afterwards.
+    if (ws <= 1.0) and (hs <= 1.0):
+        x, y = numpy.broadcast_arrays(numpy.asarray(x, dtype=float),
+                                      numpy.asarray(y, dtype=float))
+        penColor = _penColor
+        try:
+            for i, (xi, yi) in enumerate(zip(x.tolist(), y.tolist())):
+                if colors is not None:
+                    setPenColor(colors[i])
+                _pixel(xi - r, yi - r)
+        finally:
+            setPenColor(penColor)
+        return
+    # Same arithmetic as filledRectangle(x-r, y-r, 2r, 2r), so a batch
+    # draws exactly the pixels of the one-at-a-time functions.
+    xs, ys = numpy.broadcast_arrays(
+        _scaleX(numpy.asarray(x, dtype=float) - r),
+        _scaleY(numpy.asarray(y, dtype=float) - r) - hs)
+    drawRect = pygame.draw.rect
+    Rect = pygame.Rect
+    if colors is None:
+        for xs, ys in zip(xs.tolist(), ys.tolist()):
+            drawRect(_surface, _penRGB, Rect(xs, ys, ws, hs), width)
+    else:
+        for xs, ys, c in zip(xs.tolist(), ys.tolist(), colors):
+            drawRect(_surface, c.getRGB(), Rect(xs, ys, ws, hs), width)
+
+def squares(x, y, r):
+    """
+    Draw on the background canvas the squares whose sides are of length
+    2r, centered on (x[i], y[i]).
+    """
+    _squares(x, y, r, None, int(round(_penRadius)))
+
+def filledSquares(x, y, r, colors=None):
+    """
+    Draw on the background canvas the filled squares whose sides are of
+    length 2r, centered on (x[i], y[i]).  If colors is not None, then
+    square i is filled with colors[i], an object of class color.Color;
+    otherwise all squares are filled with the pen color.
+    """
+    _squares(x, y, r, colors, 0)
+
+def texts(x, y, strings, bold=False):
+    """
+    Draw strings[i] on the background canvas centered at (x[i], y[i]),
+    as bold text if bold is True.
+    """
+    _makeSureWindowCreated()
+    xs, ys = numpy.broadcast_arrays(_scaleXs(x), _scaleYs(y))
+    font = _font(bold)
+    render = font.render
+    blit = _surface.blit
+    for xs, ys, s in zip(xs.tolist(), ys.tolist(), strings):
+        text = render(s, 1, _penRGB)
+        blit(text, text.get_rect(center=(xs, ys)))
+
+#-----------------------------------------------------------------------
+
 def _show():
     """
     Copy the background canvas to the window canvas.
     """
-    _background.blit(_surface, (0, 0))
-    pygame.display.flip()
+    _backend.show(_surface)
     _checkForEvents()
 
 def _showAndWaitForever():
@@ -573,10 +916,8 @@ def _showAndWaitForever():
     """
     _makeSureWindowCreated()
     _show()
-    QUANTUM = .1
     while True:
-        time.sleep(QUANTUM)
-        _checkForEvents()
+        waitForEvent()
 
 def show(msec=float('inf')):
     """
@@ -605,113 +946,208 @@ def show(msec=float('inf')):
 
 #-----------------------------------------------------------------------
 
-def _saveToFile():
-    """
-    Display a dialog box that asks the user for a file name.  Save the
-    drawing to the specified file.  Display a confirmation dialog box
-    if successful, and an error dialog box otherwise.  The dialog boxes
-    are displayed using Tkinter, which (on some computers) is
-    incompatible with Pygame. So the dialog boxes must be displayed
-    from child processes.
-    """
-    import subprocess
-    _makeSureWindowCreated()
-
-    stddrawPath = os.path.realpath(__file__)
-
-    childProcess = subprocess.Popen(
-        [sys.executable, stddrawPath, 'getFileName'],
-        stdout=subprocess.PIPE)
-    so, se = childProcess.communicate()
-    fileName = so.strip()
+#-----------------------------------------------------------------------
 
-    if sys.hexversion >= 0x03000000:
-        fileName = fileName.decode('utf-8')
+# Screenshots.  screenshot() only copies the canvas; a worker thread
+# encodes the copies and writes them to files, so that taking a
+# screenshot does not stall the program.
 
-    if fileName == '':
-        return
-
-    if not fileName.endswith(('.jpg', '.png')):
-        childProcess = subprocess.Popen(
-            [sys.executable, stddrawPath, 'reportFileSaveError',
-            'File name must end with ".jpg" or ".png".'])
-        return
+_SCREENSHOT_QUEUE_SIZE = 8  # Screenshots waiting to be written, at most
+_screenshotQueue = None     # Created with the worker thread on first use
+_screenshotCount = 0        # Screenshots taken so far
 
+def screenshot(directory='.'):
+    """
+    Save a copy of the background canvas as a PNG file in directory,
+    named after the current time, and return the name of the file.
+    The file is written by a background thread, so it may not exist
+    yet when this function returns.  If too many screenshots are still
+    waiting to be written, then take none and return None.
+    """
+    global _screenshotQueue
+    global _screenshotCount
+    _makeSureWindowCreated()
+    if _screenshotQueue is None:
+        _screenshotQueue = queue.Queue(_SCREENSHOT_QUEUE_SIZE)
+        threading.Thread(target=_writeScreenshots, daemon=True).start()
+        atexit.register(_screenshotQueue.join)
+    _screenshotCount += 1
+    now = time.time()
+    fileName = os.path.join(directory, 'screenshot-%s-%03d-%d.png' % (
+        time.strftime('%Y%m%d-%H%M%S', time.localtime(now)),
+        int(now * 1000) % 1000, _screenshotCount))
     try:
-        save(fileName)
-        childProcess = subprocess.Popen(
-            [sys.executable, stddrawPath, 'confirmFileSave'])
-    except (pygame.error) as e:
-        childProcess = subprocess.Popen(
-            [sys.executable, stddrawPath, 'reportFileSaveError', str(e)])
+        _screenshotQueue.put_nowait((_surface.copy(), fileName))
+    except queue.Full:
+        return None
+    return fileName
+
+def _writeScreenshots():
+    """
+    Write the screenshots put in the screenshot queue, forever.
+    """
+    while True:
+        surface, fileName = _screenshotQueue.get()
+        try:
+            os.makedirs(os.path.dirname(fileName) or '.', exist_ok=True)
+            pygame.image.save(surface, fileName)
+        except (pygame.error, OSError) as e:
+            sys.stderr.write('Could not save %s: %s\n' % (fileName, e))
+        finally:
+            _screenshotQueue.task_done()
 
 def _checkForEvents():
     """
     Check if any new event has occured (such as a key typed or button
-    pressed).  If a key has been typed, then put that key in a queue.
+    pressed).  If a key has been pressed or released, then put that
+    key event in a queue.
     """
-    global _surface
-    global _keysTyped
-    
+    _makeSureWindowCreated()
+
+    for event in _backend.getEvents():
+        _handleEvent(event)
+
+def _handleEvent(event):
+    """
+    Update the key, mouse and window state to reflect event.
+    """
+    global _mousePos
+    global _mousePressed
+
+    if event.type == pygame.QUIT:
+        sys.exit()
+    elif event.type == pygame.KEYDOWN:
+        _keyEvent(KEY_DOWN, pygame.key.name(event.key))
+    elif event.type == pygame.KEYUP:
+        _keyEvent(KEY_UP, pygame.key.name(event.key))
+    elif event.type == _POSTED_KEY:
+        _keyEvent(event.kind, event.key)
+    elif event.type == pygame.WINDOWFOCUSLOST:
+        # Key releases are not reported to an unfocused window, so
+        # release every held key now rather than leave it stuck.
+        now = time.time()
+        for key in _keysDown:
+            _keyEvents.append(KeyEvent(KEY_UP, key, now))
+        _keysDown.clear()
+    elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+        # Repaint the window from the background canvas, which still
+        # holds the last frame that was shown.
+        _backend.show(_surface)
+    elif (event.type == pygame.MOUSEBUTTONUP) and \
+        (event.button == 3):
+        screenshot()
+        
     #-------------------------------------------------------------------
     # Begin added by Alan J. Broder
     #-------------------------------------------------------------------
-    global _mousePos
-    global _mousePressed
+    # Every time the mouse button is pressed, remember
+    # the mouse position as of that press.
+    elif (event.type == pygame.MOUSEBUTTONDOWN) and \
+        (event.button == 1): 
+        _mousePressed = True
+        _mousePos = event.pos                      
     #-------------------------------------------------------------------
     # End added by Alan J. Broder
     #-------------------------------------------------------------------
-    
+
+def _keyEvent(kind, key):
+    """
+    Put a key event of the given kind for the key named key in the
+    queue of key events.
+    """
+    if kind == KEY_DOWN:
+        _keysDown.add(key)
+    else:
+        _keysDown.discard(key)
+    _keyEvents.append(KeyEvent(kind, key, time.time()))
+
+def waitForEvent(msec=float('inf')):
+    """
+    Sleep until the user generates an event (such as a key typed, a
+    button pressed or the window uncovered) or until msec milliseconds
+    have passed, whichever comes first.  Nothing is redrawn, so use
+    this instead of show() on screens whose drawing does not change.
+    msec defaults to infinity.  Return True if an event arrived.
+    """
     _makeSureWindowCreated()
+    # pygame treats a timeout of 0 as no timeout at all.
+    timeout = 0 if msec == float('inf') else max(1, int(msec))
+    event = _backend.waitEvent(timeout)
+    if event.type == pygame.NOEVENT:
+        return False
+    _handleEvent(event)
+    _checkForEvents()
+    return True
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            sys.exit()
-        elif event.type == pygame.KEYDOWN:
-            _keysTyped = [pygame.key.name(event.key)] + _keysTyped
-        elif (event.type == pygame.MOUSEBUTTONUP) and \
-            (event.button == 3):
-            _saveToFile()
-            
-        #---------------------------------------------------------------
-        # Begin added by Alan J. Broder
-        #---------------------------------------------------------------
-        # Every time the mouse button is pressed, remember
-        # the mouse position as of that press.
-        elif (event.type == pygame.MOUSEBUTTONDOWN) and \
-            (event.button == 1): 
-            _mousePressed = True
-            _mousePos = event.pos                      
-        #---------------------------------------------------------------
-        # End added by Alan J. Broder
-        #---------------------------------------------------------------
+def pollEvents():
+    """
+    Handle the events that arrived since the last call, without waiting
+    and without redrawing.  For programs that run their own event loop
+    (such as asyncio) instead of waiting in show() or waitForEvent().
+    Return True if any event arrived.
+    """
+    _makeSureWindowCreated()
+    arrived = False
+    for event in _backend.getEvents():
+        _handleEvent(event)
+        arrived = True
+    return arrived
 
 #-----------------------------------------------------------------------
 
 # Functions for retrieving keys
 
+def _discardKeyReleases():
+    """
+    Remove the key-up events at the front of the key event queue.
+    """
+    while _keyEvents and _keyEvents[0].kind == KEY_UP:
+        _keyEvents.popleft()
+
 def hasNextKeyTyped():
     """
     Return True if the queue of the keys the user typed is not empty.
-    Otherwise return False.
+    Otherwise return False.  Key-up events are skipped.
     """
-    global _keysTyped
-    return _keysTyped != []
+    _discardKeyReleases()
+    return bool(_keyEvents)
 
 def nextKeyTyped():
     """
     Remove the first key from the queue of the keys that the user typed,
-    and return that key.
+    and return that key.  Key-up events are skipped.
     """
-    global _keysTyped
-    return _keysTyped.pop()
+    _discardKeyReleases()
+    return _keyEvents.popleft().key
 
 def clearKeysTyped():
     """
     Clear all the keys in the queue of the keys that the user typed.
     """
-    global _keysTyped
-    _keysTyped = []
+    _keyEvents.clear()
+
+def hasNextKeyEvent():
+    """
+    Return True if the queue of key events is not empty.  Otherwise
+    return False.
+    """
+    return bool(_keyEvents)
+
+def nextKeyEvent():
+    """
+    Remove the oldest event from the queue of key events, and return it.
+    The event is a KeyEvent whose kind is KEY_DOWN or KEY_UP, whose key
+    is the name of the key, and whose time is the time.time() at which
+    the event was received.
+    """
+    return _keyEvents.popleft()
+
+def isKeyDown(key):
+    """
+    Return True if the key named key is currently held down.  Otherwise
+    return False.
+    """
+    return key in _keysDown
 
 #-----------------------------------------------------------------------
 # Begin added by Alan J. Broder
@@ -768,41 +1204,8 @@ setXscale()
 setYscale()
 setPenRadius()
 pygame.font.init()
-
-#-----------------------------------------------------------------------
-
-# Functions for displaying Tkinter dialog boxes in child processes.
-
-def _getFileName():
-    """
-    Display a dialog box that asks the user for a file name.
-    """
-    root = Tkinter.Tk()
-    root.withdraw()
-    reply = tkFileDialog.asksaveasfilename(initialdir='.')
-    sys.stdout.write(reply)
-    sys.stdout.flush()
-    sys.exit()
-
-def _confirmFileSave():
-    """
-    Display a dialog box that confirms a file save operation.
-    """
-    root = Tkinter.Tk()
-    root.withdraw()
-    tkMessageBox.showinfo(title='File Save Confirmation',
-        message='The drawing was saved to the file.')
-    sys.exit()
-
-def _reportFileSaveError(msg):
-    """
-    Display a dialog box that reports a msg.  msg is a string which
-    describes an error in a file save operation.
-    """
-    root = Tkinter.Tk()
-    root.withdraw()
-    tkMessageBox.showerror(title='File Save Error', message=msg)
-    sys.exit()
+_drawingFunctions.update((name, globals()[name]) for name in _DRAWING_FUNCTIONS)
+setBackend(os.environ.get('STDDRAW_BACKEND', 'window'))
 
 #-----------------------------------------------------------------------
 
@@ -903,6 +1306,14 @@ def _regressionTest():
     text(.2, .4, 'hello, world')
     show(0.0)
 
+    setPenRadius(0)
+    setPenColor(BOOK_BLUE)
+    lines([.05, .05, .05], [.05, .1, .15], [.15, .15, .15], [.05, .1, .15])
+    filledSquares([.05, .1, .15], .95, .02, [BOOK_RED, BOOK_BLUE, BOOK_RED])
+    squares([.05, .1, .15], .9, .02)
+    texts([.05, .1, .15], .85, ['a', 'b', 'c'])
+    show(0.0)
+
     #import picture as p
     #pic = p.Picture('saveIcon.png')
     #picture(pic, .5, .85)
@@ -925,18 +1336,9 @@ def _regressionTest():
 
 def _main():
     """
-    Dispatch to a function that does regression testing, or to a
-    dialog-box-handling function.
-    """
-    import sys
-    if len(sys.argv) == 1:
-        _regressionTest()
-    elif sys.argv[1] == 'getFileName':
-        _getFileName()
-    elif sys.argv[1] == 'confirmFileSave':
-        _confirmFileSave()
-    elif sys.argv[1] == 'reportFileSaveError':
-        _reportFileSaveError(sys.argv[2])
+    Do regression testing.
+    """
+    _regressionTest()
 
 if __name__ == '__main__':
     _main()
@@ -0,0 +1,90 @@
+import collections  # used for the record of the placements of a piece
+import numpy as np  # used for building the boards of all placements at once
+from features import column_heights  # the landing row depends on the heights
+from game_grid import GameGrid  # used for resolving the merges of a placement
+from point import Point  # used for the position of the locked tiles
+from tile import Tile  # used for building the tiles of a played placement
+
+# Every way to drop a piece on a board, as arrays with one entry per placement:
+#   rotations: clockwise quarter turns of the piece before it is dropped
+#   columns:   x of the bottom-left cell of the rotated piece (the column
+#              recorded by dataset.DatasetWriter)
+#   rows:      y of the bottom-left cell where the piece lands
+#   boards:    boards with the piece locked, before any merges or clears
+#   game_over: True where a tile of the piece would stick out of the grid
+Placements = collections.namedtuple(
+    "Placements", ["rotations", "columns", "rows", "boards", "game_over"])
+
+
+# A function that returns the rotations of a piece that differ from each other,
+# as a list of (quarter turns, rotated matrix) pairs. tiles is the matrix of
+# exponents of the piece (e.g. Tetromino.tile_exponents()).
+def distinct_rotations(tiles):
+    rotations, seen = [], set()
+    matrix = np.asarray(tiles, dtype=np.uint8)
+    for turns in range(4):
+        key = matrix.tobytes()
+        if key not in seen:
+            seen.add(key)
+            rotations.append((turns, matrix))
+        matrix = np.rot90(matrix, k=3)  # clockwise, as Tetromino._rot90
+    return rotations
+
+
+# A function that enumerates every placement of a piece on a board: every
+# distinct rotation dropped straight down from above the stack in every
+# column where it fits. board is a matrix of exponents as returned by
+# GameGrid.exponent_matrix and tiles is the matrix of exponents of the piece.
+# The boards of all placements are built with array operations, so they can be
+# scored with one call of features.board_features.
+def enumerate_placements(board, tiles):
+    board = np.asarray(board, dtype=np.uint8)
+    grid_h, grid_w = board.shape
+    heights = column_heights(board)
+    rotations, columns, rows, cells_y, cells_x, values = [], [], [], [], [], []
+    for turns, matrix in distinct_rotations(tiles):
+        n = len(matrix)
+        r, c = np.nonzero(matrix)
+        # Lowest tile of every column of the piece, as an offset from its bottom
+        bottom = np.full(n, n, dtype=np.int32)
+        np.minimum.at(bottom, c, (n - 1) - r)
+        piece_cols = np.nonzero(bottom < n)[0]
+        xs = np.arange(-piece_cols.min(), grid_w - piece_cols.max())
+        # The piece lands where the first of its columns reaches the stack
+        ys = (heights[xs[:, None] + piece_cols] - bottom[piece_cols]).max(axis=1)
+        rotations.append(np.full(len(xs), turns))
+        columns.append(xs)
+        rows.append(ys)
+        cells_y.append(ys[:, None] + ((n - 1) - r))
+        cells_x.append(xs[:, None] + c)
+        values.append(np.broadcast_to(matrix[r, c], (len(xs), len(r))))
+    cells_y, cells_x = np.concatenate(cells_y), np.concatenate(cells_x)
+    values = np.concatenate(values)
+    count = len(cells_y)
+    game_over = (cells_y >= grid_h).any(axis=1)
+    boards = np.repeat(board[None], count, axis=0)
+    inside = cells_y < grid_h
+    index = np.broadcast_to(np.arange(count)[:, None], cells_y.shape)
+    boards[index[inside], cells_y[inside], cells_x[inside]] = values[inside]
+    return Placements(np.concatenate(rotations), np.concatenate(columns),
+                      np.concatenate(rows), boards, game_over)
+
+
+# A function that plays placement i of enumerate_placements(board, tiles) with
+# the rules of the game (merges, cleared rows, falling tiles) and returns the
+# resulting board, the points scored and whether the game is over
+def play_placement(board, tiles, placements, i, grid=None):
+    board = np.asarray(board, dtype=np.uint8)
+    grid_h, grid_w = board.shape
+    if grid is None:
+        grid = GameGrid(grid_h, grid_w)
+    grid.set_exponent_matrix(board)
+    grid.score, grid.win, grid.game_over = 0, False, False
+    matrix = np.rot90(np.asarray(tiles, dtype=np.uint8),
+                      k=-int(placements.rotations[i]))
+    locked = np.full(matrix.shape, None)
+    for r, c in zip(*np.nonzero(matrix)):
+        locked[r][c] = Tile(1 << int(matrix[r][c]))
+    game_over = grid.update_grid(
+        locked, Point(int(placements.columns[i]), int(placements.rows[i])))
+    return grid.exponent_matrix(), grid.score, bool(game_over)
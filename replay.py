@@ -0,0 +1,201 @@
+import bisect  # used for finding the keyframe and pose shown at a given time
+import collections  # used for the records of a replay
+import time  # used for timestamping the recorded states
+import numpy as np  # used for storing the boards and saving replays
+from game_grid import GameGrid  # the class for modeling the game grid
+from tetromino import Tetromino  # the class for modeling the tetrominoes
+
+# The state right after a game starts or a piece locks: the time, the board as
+# a matrix of tile exponents, the score, the falling piece and the next piece.
+# Pieces are PieceState records, and current is None once the game has ended.
+Keyframe = collections.namedtuple(
+    "Keyframe", ["time", "board", "score", "current", "next"])
+# A piece with its type, its matrix of tile exponents and the position of its
+# bottom-left cell when the keyframe was taken
+PieceState = collections.namedtuple("PieceState", ["type", "tiles", "x", "y"])
+# A move of the falling piece of a keyframe: the time, the position of the
+# bottom-left cell and the number of quarter turns since the keyframe
+Pose = collections.namedtuple("Pose", ["time", "keyframe", "x", "y", "rotation"])
+
+# Tile matrices of all pieces are padded to this size when a replay is saved
+_PIECE_SIZE = 4
+
+
+# A class for modeling the recording of one game. The board only changes when
+# a piece locks, so a replay is a keyframe for every lock plus the poses of
+# the falling piece in between; any frame can be rebuilt from the keyframe
+# before it without replaying the game from the start.
+class Replay:
+    def __init__(self, grid_h, grid_w):
+        self.grid_height, self.grid_width = grid_h, grid_w
+        self.keyframes = []  # Keyframe records in time order
+        self.poses = []  # Pose records in time order
+        self.end_time = None  # Time at which the game ended
+        self._keyframe_times, self._pose_times = [], []  # Searched by state_at
+
+    # The time of the first keyframe and the time at which the replay ends
+    def start(self):
+        return self.keyframes[0].time
+
+    def end(self):
+        if self.end_time is not None:
+            return self.end_time
+        last = self.poses[-1].time if self.poses else self.start()
+        return max(last, self.keyframes[-1].time)
+
+    # A method that returns the index of the keyframe and the pose (or None
+    # if the piece has not moved since the keyframe) shown at time t
+    def state_at(self, t):
+        self._update_times()
+        k = max(0, bisect.bisect_right(self._keyframe_times, t) - 1)
+        i = bisect.bisect_right(self._pose_times, t) - 1
+        pose = self.poses[i] if i >= 0 and self.poses[i].keyframe == k else None
+        return k, pose
+
+    # A method that builds the game grid (with its falling piece) and the next
+    # piece shown at keyframe k after the falling piece moved to pose
+    # (a grid from an earlier call may be given to be refilled)
+    def build(self, k, pose=None, grid=None):
+        keyframe = self.keyframes[k]
+        if grid is None:
+            grid = GameGrid(self.grid_height, self.grid_width)
+        grid.set_exponent_matrix(keyframe.board)
+        grid.score = int(keyframe.score)
+        grid.win = bool(keyframe.board.max() >= 11)  # 2048 = 2 ** 11
+        grid.current_tetromino = self.current_piece(k, pose)
+        return grid, self._tetromino(keyframe.next)
+
+    # A method that builds the falling piece of keyframe k after it moved to
+    # pose, or returns None if the game had ended at keyframe k
+    def current_piece(self, k, pose=None):
+        state = self.keyframes[k].current
+        if state is None:
+            return None
+        current = self._tetromino(state)
+        if pose is not None:
+            current.bottom_left_cell.move(pose.x, pose.y)
+            for _ in range(pose.rotation):
+                current.tile_matrix = Tetromino._rot90(current.tile_matrix)
+        return current
+
+    # A method that builds a Tetromino from a PieceState of this replay
+    def _tetromino(self, state):
+        Tetromino.grid_height = self.grid_height
+        Tetromino.grid_width = self.grid_width
+        return Tetromino.from_tile_exponents(state.type, state.tiles,
+                                             state.x, state.y)
+
+    # A method that brings the lists of keyframe and pose times searched by
+    # state_at up to date with the records
+    def _update_times(self):
+        times = self._keyframe_times
+        times.extend(kf.time for kf in self.keyframes[len(times):])
+        times = self._pose_times
+        times.extend(pose.time for pose in self.poses[len(times):])
+
+    # A method that saves the replay to a compressed NumPy (.npz) file
+    def save(self, path):
+        kfs = self.keyframes
+        pieces = {}
+        for name in ("current", "next"):
+            states = [getattr(kf, name) for kf in kfs]
+            tiles = np.zeros((len(kfs), _PIECE_SIZE, _PIECE_SIZE), dtype=np.uint8)
+            for i, state in enumerate(states):
+                if state is not None:
+                    n = len(state.tiles)
+                    tiles[i, :n, :n] = state.tiles
+            pieces[name + "_type"] = np.array(
+                ["" if state is None else state.type for state in states], dtype="U1")
+            pieces[name + "_tiles"] = tiles
+            pieces[name + "_pos"] = np.array(
+                [(0, 0) if state is None else (state.x, state.y) for state in states],
+                dtype=np.int32).reshape(len(kfs), 2)
+        np.savez_compressed(
+            path,
+            size=np.array([self.grid_height, self.grid_width]),
+            end_time=np.array(self.end()),
+            keyframe_time=np.array([kf.time for kf in kfs], dtype=np.float64),
+            keyframe_board=np.array([kf.board for kf in kfs], dtype=np.uint8),
+            keyframe_score=np.array([kf.score for kf in kfs], dtype=np.int64),
+            pose_time=np.array([p.time for p in self.poses], dtype=np.float64),
+            pose_data=np.array([p[1:] for p in self.poses],
+                               dtype=np.int32).reshape(len(self.poses), 4),
+            **pieces)
+
+    # A method that loads a replay saved with save
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            grid_h, grid_w = (int(v) for v in data["size"])
+            replay = Replay(grid_h, grid_w)
+            replay.end_time = float(data["end_time"])
+            states = {}
+            for name in ("current", "next"):
+                states[name] = [
+                    None if not t else PieceState(
+                        str(t), tiles[:_piece_size(t), :_piece_size(t)].copy(),
+                        int(pos[0]), int(pos[1]))
+                    for t, tiles, pos in zip(data[name + "_type"],
+                                             data[name + "_tiles"],
+                                             data[name + "_pos"])]
+            replay.keyframes = [
+                Keyframe(float(t), board, int(score), current, nxt)
+                for t, board, score, current, nxt in zip(
+                    data["keyframe_time"], data["keyframe_board"],
+                    data["keyframe_score"], states["current"], states["next"])]
+            replay.poses = [
+                Pose(float(t), *(int(v) for v in row))
+                for t, row in zip(data["pose_time"], data["pose_data"])]
+        return replay
+
+
+# A class for recording a game into a Replay while it is being played
+class ReplayRecorder:
+    def __init__(self, grid_h, grid_w):
+        self.replay = Replay(grid_h, grid_w)
+        self._last_pose = None  # (x, y, rotation) of the last recorded pose
+        self._rotation = 0  # rotation of the falling piece at the last keyframe
+
+    # A method that records the state of the game after it starts or after a
+    # piece locks, with current being None if the game has ended
+    def keyframe(self, grid, current, next_piece):
+        self.replay.keyframes.append(Keyframe(
+            time.time(), grid.exponent_matrix(), grid.score,
+            _piece_state(current), _piece_state(next_piece)))
+        self._rotation = current.rotation if current is not None else 0
+        self._last_pose = _pose_key(current, self._rotation)
+
+    # A method that records the position of the falling piece if it moved
+    # since the last call (it is meant to be called once every frame)
+    def pose(self, current):
+        key = _pose_key(current, self._rotation)
+        if key != self._last_pose:
+            self._last_pose = key
+            self.replay.poses.append(Pose(
+                time.time(), len(self.replay.keyframes) - 1, *key))
+
+    # A method that records the final state of the game and the end time
+    def finish(self, grid, next_piece):
+        self.keyframe(grid, None, next_piece)
+        self.replay.end_time = time.time()
+        return self.replay
+
+
+# Size of the tile matrix of each tetromino type
+def _piece_size(t):
+    return 4 if t == "I" else 2 if t == "O" else 3
+
+
+def _piece_state(piece):
+    if piece is None:
+        return None
+    return PieceState(piece.type, piece.tile_exponents(),
+                      piece.bottom_left_cell.x, piece.bottom_left_cell.y)
+
+
+def _pose_key(piece, rotation_at_keyframe):
+    if piece is None:
+        return None
+    return (piece.bottom_left_cell.x, piece.bottom_left_cell.y,
+            (piece.rotation - rotation_at_keyframe) % 4)
+
@@ -0,0 +1,154 @@
+import collections  # used for the queue of segments being rendered
+import multiprocessing  # used for rendering the segments on all cores
+import os  # used for the names of the exported files
+import shutil  # used for finding the ffmpeg program
+import subprocess  # used for running ffmpeg
+from replay import Replay  # the class for modeling recorded games
+
+RIGHT_PANEL_W = 6  # Width of the panel next to the grid, as in play_one_game
+MAX_SEGMENT_FRAMES = 30  # Frames rendered by a worker in one task
+FRAME_NAME = "frame%06d.png"  # File names of the frames of an image sequence
+
+
+# A function for exporting the replay saved in replay_path as a clip. If output
+# has no extension, it is a directory that receives the frames as PNG images;
+# otherwise it is a video or GIF file written by ffmpeg, which picks the format
+# from the extension. speed is the number of seconds of the game per second of
+# the clip. The frames are rendered offscreen by a pool of worker processes,
+# each of which starts from a keyframe of the replay, and are streamed to the
+# encoder in order, so only the segments being worked on are held in memory.
+# Returns the number of frames exported.
+def export_replay(replay_path, output, fps=30, speed=1.0, workers=None,
+                  cell_size=40):
+    replay = Replay.load(replay_path)
+    segments = _segments(replay, fps, speed)
+    width = cell_size * (replay.grid_width + RIGHT_PANEL_W)
+    height = cell_size * replay.grid_height
+    image_sequence = not os.path.splitext(output)[1]
+    if image_sequence:
+        os.makedirs(output, exist_ok=True)
+        encoder = None
+    else:
+        encoder = _start_encoder(output, width, height, fps)
+
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context("spawn")  # workers open no window
+    with context.Pool(workers, _init_worker,
+                      (replay_path, cell_size,
+                       output if image_sequence else None)) as pool:
+        # At most two segments per worker are queued or waiting to be encoded
+        pending = collections.deque()
+        for segment in segments:
+            pending.append(pool.apply_async(_render_segment, (segment,)))
+            if len(pending) == 2 * workers:
+                _encode(encoder, pending.popleft().get())
+        while pending:
+            _encode(encoder, pending.popleft().get())
+
+    if encoder is not None:
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise IOError("ffmpeg could not write " + output)
+    return sum(len(times) for _, times in segments)
+
+
+# A function that splits the frames of the clip into segments, each a pair of
+# the index of its first frame and the game times of its frames. Segments
+# start at keyframes, and long stretches between two keyframes are split into
+# segments of at most MAX_SEGMENT_FRAMES frames.
+def _segments(replay, fps, speed):
+    start, end = replay.start(), replay.end()
+    count = int((end - start) * fps / speed) + 1
+    times = [start + i * speed / fps for i in range(count)]
+    if times[-1] < end:
+        times.append(end)  # The clip always ends on the final board
+        count += 1
+    segments, first = [], 0
+    for i in range(1, count + 1):
+        if i == count or i - first == MAX_SEGMENT_FRAMES or \
+                replay.state_at(times[i])[0] != replay.state_at(times[i - 1])[0]:
+            segments.append((first, times[first:i]))
+            first = i
+    return segments
+
+
+# A function that sends the frames of a segment to the encoder, if any
+def _encode(encoder, frames):
+    if encoder is not None:
+        encoder.stdin.write(frames)
+
+
+# A function that starts an ffmpeg process reading raw RGB frames from a pipe
+def _start_encoder(output, width, height, fps):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise IOError("ffmpeg is needed to export videos and GIFs; "
+                      "give a directory name to export PNG frames instead")
+    command = [ffmpeg, "-loglevel", "error", "-y",
+               "-f", "rawvideo", "-pix_fmt", "rgb24",
+               "-s", "%dx%d" % (width, height), "-r", str(fps), "-i", "-"]
+    if not output.lower().endswith(".gif"):
+        command += ["-pix_fmt", "yuv420p"]  # Playable by common video players
+    return subprocess.Popen(command + [output], stdin=subprocess.PIPE)
+
+
+# State of a worker process, set once by _init_worker
+_worker = {}
+
+
+# A function that prepares a worker process for rendering frames offscreen
+def _init_worker(replay_path, cell_size, directory):
+    import lib.stddraw as stddraw
+    replay = Replay.load(replay_path)
+    grid_w_total = replay.grid_width + RIGHT_PANEL_W
+    stddraw.setBackend("offscreen")
+    stddraw.setCanvasSize(cell_size * grid_w_total, cell_size * replay.grid_height)
+    stddraw.setXscale(-0.5, grid_w_total - 0.5)
+    stddraw.setYscale(-0.5, replay.grid_height - 0.5)
+    _worker.update(replay=replay, directory=directory)
+
+
+# A function that renders the frames of a segment in a worker process. It
+# writes them as PNG files if the clip is an image sequence and returns b"",
+# otherwise it returns the RGB bytes of all the frames.
+def _render_segment(segment):
+    import lib.stddraw as stddraw
+    import Tetris_2048
+    first, times = segment
+    replay, directory = _worker["replay"], _worker["directory"]
+    frames, grid, shown = [], None, None
+    for i, t in enumerate(times):
+        k, pose = replay.state_at(t)
+        if shown != k:  # Rebuild the board only when the keyframe changes
+            grid, next_piece = replay.build(k, pose, grid)
+            shown = k
+        else:
+            grid.current_tetromino = replay.current_piece(k, pose)
+        Tetris_2048.draw_frame(grid, next_piece)
+        if grid.current_tetromino is None:  # The game has ended
+            Tetris_2048.draw_game_over(replay.grid_width + RIGHT_PANEL_W,
+                                       replay.grid_height, grid.win)
+        if directory is not None:
+            stddraw.save(os.path.join(directory, FRAME_NAME % (first + i)))
+        else:
+            frames.append(stddraw.getFrame().tobytes())
+    return b"".join(frames)
+
+
+if __name__ == "__main__":
+    import argparse  # used for reading the command line options
+    parser = argparse.ArgumentParser(
+        description="Export a replay saved by Tetris_2048.py --record")
+    parser.add_argument("replay", help="replay file (.npz)")
+    parser.add_argument("output", help="video or GIF file, or a directory "
+                                       "for PNG frames")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="seconds of the game per second of the clip")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cell-size", type=int, default=40,
+                        help="pixels per grid cell")
+    args = parser.parse_args()
+    n = export_replay(args.replay, args.output, args.fps, args.speed,
+                      args.workers, args.cell_size)
+    print("%d frames exported to %s" % (n, args.output))
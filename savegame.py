@@ -0,0 +1,192 @@
+import collections  # used for the record of a loaded game
+import os  # used for replacing save files atomically
+import queue  # used for handing the states to the autosave thread
+import socket  # used for naming the temporary files of the writers
+import struct  # used for packing the fixed-size fields
+import threading  # used for writing autosaves in the background
+import zlib  # used for the checksum that detects damaged files
+import numpy as np  # used for packing the boards
+from game_grid import GameGrid  # the class for modeling the game grid
+from tetromino import Tetromino, PieceStream, TETROMINO_TYPES
+
+# Layout of a saved game (all integers little-endian):
+#   header: magic, version, grid height and width, flags (bit 0: win, bit 1:
+#           game over), fall delay, score, seed and index of the piece stream
+#   current piece and next piece: type (index in TETROMINO_TYPES, or 255 for
+#           no piece), rotation, position of the bottom-left cell and the
+#           tile matrix padded to 4x4, as exponents packed two per byte
+#   board:  the exponent of every cell, row by row from the bottom, packed
+#           two per byte (0 for an empty cell, 1 for 2, 2 for 4, ...)
+#   CRC-32 of everything before it
+# A 20x12 game takes 188 bytes.
+MAGIC = b"T48S"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBBBdQQI")
+_PIECE = struct.Struct("<BBhh8s")
+_CRC = struct.Struct("<I")
+_NO_PIECE = 255
+_PIECE_SIZE = 4  # Tile matrices of the pieces are padded to this size
+MAX_EXPONENT = 15  # Largest exponent that fits in 4 bits (32768)
+
+# A game restored by unpack_state: the grid (with its falling tetromino), the
+# next tetromino, the piece stream that makes the following ones and the fall
+# delay the game was played with
+SavedGame = collections.namedtuple(
+    "SavedGame", ["grid", "next_piece", "pieces", "fall_delay"])
+
+
+# A function that returns the state of a game packed into bytes
+def pack_state(grid, next_piece, pieces, fall_delay):
+    flags = (1 if grid.win else 0) | (2 if grid.game_over else 0)
+    header = _HEADER.pack(MAGIC, VERSION, grid.grid_height, grid.grid_width,
+                          flags, fall_delay, grid.score, pieces.seed,
+                          pieces.index)
+    data = b"".join((header, _pack_piece(grid.current_tetromino),
+                     _pack_piece(next_piece),
+                     _pack_exponents(grid.exponent_matrix())))
+    return data + _CRC.pack(zlib.crc32(data))
+
+
+# A function that rebuilds the game packed by pack_state, raising ValueError if
+# the data is not a saved game of a supported version or is damaged
+def unpack_state(data):
+    if len(data) < _HEADER.size + _CRC.size or \
+            zlib.crc32(data[:-_CRC.size]) != _CRC.unpack_from(data, len(data) - _CRC.size)[0]:
+        raise ValueError("not a saved game, or a damaged one")
+    magic, version, grid_h, grid_w, flags, fall_delay, score, seed, index = \
+        _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("unsupported saved game version")
+    # Tetrominoes are placed relative to the grid they are created for
+    Tetromino.grid_height, Tetromino.grid_width = grid_h, grid_w
+    offset = _HEADER.size
+    current = _unpack_piece(data, offset)
+    next_piece = _unpack_piece(data, offset + _PIECE.size)
+    offset += 2 * _PIECE.size
+    grid = GameGrid(grid_h, grid_w)
+    grid.set_exponent_matrix(
+        _unpack_exponents(data[offset:-_CRC.size], grid_h * grid_w)
+        .reshape(grid_h, grid_w))
+    grid.score = score
+    grid.win, grid.game_over = bool(flags & 1), bool(flags & 2)
+    grid.current_tetromino = current
+    return SavedGame(grid, next_piece, PieceStream(seed, index), fall_delay)
+
+
+# A function that writes bytes to a file so that the file never holds a
+# partly written game, even if the program stops while writing
+def write_atomically(path, data):
+    # Every writer has its own temporary file, so writers of the same path
+    # (e.g. processes on several nodes) never write into each other's file
+    tmp_path = "%s.%s-%d-%d.tmp" % (path, socket.gethostname(), os.getpid(),
+                                    threading.get_ident())
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):  # Do not leave the partly written file behind
+            os.remove(tmp_path)
+        raise
+
+
+# A function that saves a game to a file
+def save_game(path, grid, next_piece, pieces, fall_delay):
+    write_atomically(path, pack_state(grid, next_piece, pieces, fall_delay))
+
+
+# A function that loads a game saved by save_game
+def load_game(path):
+    with open(path, "rb") as f:
+        return unpack_state(f.read())
+
+
+# A class for saving the game being played to a file every now and then. The
+# state is packed on the calling thread, which is fast, and written by a
+# background thread, so that disk writes never delay a frame.
+class Autosaver:
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval  # Seconds between two autosaves, at least
+        self._last_save = None  # Time of the last autosave
+        self._pending = queue.Queue(1)  # Holds the newest state not written yet
+        self._lock = threading.Lock()  # Held while the file is written or removed
+        self._generation = 0  # Increased by clear; states of earlier generations are not written
+        threading.Thread(target=self._write_states, daemon=True).start()
+
+    # A method that autosaves the game if the interval has passed since the
+    # last autosave (or always if force is True)
+    def save(self, now, grid, next_piece, pieces, fall_delay, force=False):
+        if not force and self._last_save is not None and \
+                now - self._last_save < self.interval:
+            return
+        self._last_save = now
+        data = self._generation, pack_state(grid, next_piece, pieces, fall_delay)
+        try:  # A state that was not written yet is replaced by the newer one
+            self._pending.get_nowait()
+        except queue.Empty:
+            pass
+        self._pending.put_nowait(data)
+
+    # A method that deletes the autosave, e.g. when the game has ended
+    def clear(self):
+        try:
+            self._pending.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            self._generation += 1  # A state taken by the writer already is dropped
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        self._last_save = None
+
+    def _write_states(self):
+        while True:
+            generation, data = self._pending.get()
+            with self._lock:
+                if generation != self._generation:
+                    continue  # The game was cleared after this state was saved
+                try:
+                    write_atomically(self.path, data)
+                except OSError:
+                    pass  # The next autosave tries again
+
+
+def _pack_exponents(exponents):
+    flat = exponents.ravel()
+    if flat.size and flat.max() > MAX_EXPONENT:
+        raise ValueError("tiles above %d cannot be saved" % (1 << MAX_EXPONENT))
+    if flat.size % 2:
+        flat = np.append(flat, 0)
+    return ((flat[0::2] << 4) | flat[1::2]).astype(np.uint8).tobytes()
+
+
+def _unpack_exponents(data, count):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    flat = np.empty(2 * packed.size, dtype=np.uint8)
+    flat[0::2], flat[1::2] = packed >> 4, packed & 15
+    return flat[:count]
+
+
+def _pack_piece(piece):
+    if piece is None:
+        return _PIECE.pack(_NO_PIECE, 0, 0, 0, bytes(_PIECE_SIZE * _PIECE_SIZE // 2))
+    tiles = np.zeros((_PIECE_SIZE, _PIECE_SIZE), dtype=np.uint8)
+    exponents = piece.tile_exponents()
+    tiles[:len(exponents), :len(exponents)] = exponents
+    return _PIECE.pack(TETROMINO_TYPES.index(piece.type), piece.rotation,
+                       piece.bottom_left_cell.x, piece.bottom_left_cell.y,
+                       _pack_exponents(tiles))
+
+
+def _unpack_piece(data, offset):
+    type_index, rotation, x, y, tiles = _PIECE.unpack_from(data, offset)
+    if type_index == _NO_PIECE:
+        return None
+    shape = TETROMINO_TYPES[type_index]
+    n = 4 if shape == "I" else 2 if shape == "O" else 3
+    tiles = _unpack_exponents(tiles, _PIECE_SIZE * _PIECE_SIZE)
+    tiles = tiles.reshape(_PIECE_SIZE, _PIECE_SIZE)[:n, :n]
+    return Tetromino.from_tile_exponents(shape, tiles, x, y, rotation)
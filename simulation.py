@@ -0,0 +1,258 @@
+import collections  # used for the snapshots of the game and the deferred input
+import queue  # used for passing the input to the simulation thread
+import threading  # used for running the simulation next to the render loop
+import time  # used for timing the gravity, key repeats and lock steps
+import lib.stddraw as stddraw  # used for the kinds of key events
+from game_grid import GameGrid  # the class for modeling the game grid
+from tetromino import Tetromino, PieceStream  # the tetrominoes and their sequence
+from replay import PieceState  # used for the pieces of the snapshots
+
+TICK_SEC        = 0.004  # Longest time the simulation waits for input between two updates
+DAS_SEC         = 0.17  # Delayed auto shift: hold time before a key starts repeating
+ARR_SEC         = 0.05  # Auto repeat rate: time between repeated moves of a held key
+REPEAT_KEYS     = ("left", "right", "down")  # Movement keys that repeat when held
+LOCK_STEP_SEC   = 0.03  # Time each intermediate board of a lock (merge, fall, clear) is shown
+
+# The state of the game at one moment, published by the simulation for the
+# render loop. Snapshots are never changed once published: board is a
+# read-only matrix of tile exponents and the pieces are PieceState records
+# (current is None while a lock is being resolved), each shared by the
+# snapshots until it changes, so comparing them with "is" finds the changes.
+# result is None while the game goes on, "menu" if the player left it for the
+# menu, and "over" once it was won or lost.
+Snapshot = collections.namedtuple(
+    "Snapshot", ["version", "board", "score", "current", "next", "paused",
+                 "win", "result"])
+
+
+# A class for running a game on its own thread. The thread handles the input,
+# the gravity and the locks; the render loop sends it the key events with
+# send and draws the latest snapshot, so a slow frame never delays the game
+# and a long lock never delays a frame.
+class GameSimulation:
+    def __init__(self, fall_delay, grid_h=20, grid_w=12, recorder=None,
+                 autosaver=None, saved=None):
+        self.fall_delay = fall_delay
+        self.recorder, self.autosaver = recorder, autosaver
+        Tetromino.grid_height, Tetromino.grid_width = grid_h, grid_w
+        if saved:  # Continue the saved game where it stopped
+            self.grid, self.next_piece = saved.grid, saved.next_piece
+            self.pieces = saved.pieces
+        else:
+            self.grid = GameGrid(grid_h, grid_w)
+            self.pieces = PieceStream()  # Sequence of pieces, restorable from its seed
+            self.grid.current_tetromino = self.pieces.next()
+            self.next_piece = self.pieces.next()
+        self.current = self.grid.current_tetromino
+        if recorder:
+            recorder.keyframe(self.grid, self.current, self.next_piece)  # Record the starting state
+
+        self.inputs = queue.Queue()  # Key events sent by the render loop
+        self.paused = False
+        self._held = {}  # Held movement keys mapped to the time of their next repeat
+        self._resolving = None  # Steps of the lock being resolved, if a piece has locked
+        self._deferred = collections.deque()  # Key events sent while a lock was resolved
+        self._next_step = 0  # Time at which the next step of the lock is due
+        self._last_fall = time.time()  # Time of the last fall of the piece
+        self._result = None
+        self._board, self._version = None, 0
+        # Pieces of the last snapshot with the keys they were made for, reused while unchanged
+        self._current_key = self._current_state = None
+        self._next_key = self._next_state = None
+        self._published = threading.Condition()  # Notified for every new snapshot
+        self._snapshot = None
+        self._error = None  # Exception that stopped the simulation thread, if any
+        self._publish(board_changed=True)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    # A method that starts the simulation thread
+    def start(self):
+        self._last_fall = time.time()
+        self._thread.start()
+
+    # A method that stops the simulation thread (if it has not ended) and
+    # waits for it
+    def stop(self):
+        self._stopped.set()
+        self.inputs.put(None)  # Wake the thread up if it waits for input
+        if self._thread.is_alive():
+            self._thread.join()
+
+    # A method that passes a key event (from stddraw.nextKeyEvent) to the game
+    def send(self, event):
+        self.inputs.put(event)
+
+    # The latest snapshot of the game. If the simulation thread failed, its
+    # exception is raised here, on the thread that draws the game.
+    @property
+    def snapshot(self):
+        if self._error is not None:
+            raise RuntimeError("the game simulation stopped") from self._error
+        return self._snapshot
+
+    # A method that waits until a snapshot newer than the given version is
+    # published or the timeout (in seconds) passes, and returns the latest one
+    def wait(self, version, timeout=None):
+        with self._published:
+            self._published.wait_for(
+                lambda: self._error is not None or self._snapshot.version > version, timeout)
+            return self.snapshot
+
+    def _run(self):
+        try:
+            self._simulate()
+        except Exception as error:  # Reported on the render thread
+            with self._published:
+                self._error = error
+                self._published.notify_all()
+
+    def _simulate(self):
+        while self._result is None and not self._stopped.is_set():
+            changed = False
+            try:  # Wake up at once when a key is pressed
+                event = self.inputs.get(timeout=None if self.paused else TICK_SEC)
+                while True:
+                    if event is not None:  # None only wakes the thread up
+                        changed = self._handle_key(event) or changed
+                    event = self.inputs.get_nowait()
+            except queue.Empty:
+                pass
+            if not self.paused and self._result is None:
+                changed = self._update(time.time()) or changed
+            if changed:
+                self._publish()
+
+    # A method that applies a key event and returns whether the game changed
+    def _handle_key(self, event):
+        key, grid, current = event.key, self.grid, self.current
+        if self._resolving and not (event.kind == stddraw.KEY_DOWN and key in ("p", "m")):
+            # Keep the input for the next piece, in order, until the lock is resolved
+            self._deferred.append(event)
+            return False
+        if event.kind == stddraw.KEY_UP:  # Stop repeating a released key
+            self._held.pop(key, None)
+            return False
+        if key == "p":  # Toggle pause
+            self.paused = not self.paused
+            self._held.clear()  # Held keys must be pressed again after pausing
+            self._deferred.clear()  # and keys sent during a lock are not applied after it
+            if self.paused and self.autosaver and not self._resolving:
+                # Save now, the game may be left paused
+                self.autosaver.save(event.time, grid, self.next_piece,
+                                    self.pieces, self.fall_delay, force=True)
+            return True
+        if self.paused and key == "m":  # Return to menu when paused
+            if self.autosaver:
+                self.autosaver.clear()  # A game left for the menu is not resumed
+            self._result = "menu"
+            return True
+        if self.paused:
+            return False  # ignore other keys while paused
+        if key in REPEAT_KEYS:  # Handle movement keys
+            self._held[key] = event.time + DAS_SEC  # First repeat after the DAS delay
+            return current.move(key, grid)
+        if key == "up":  # Handle rotation
+            return current.move("rotate", grid)
+        if key == "space":  # Hard drop - move down until collision
+            moved = False
+            while current.move("down", grid):
+                moved = True
+            return moved
+        return False
+
+    # A method that advances the game to time now and returns whether it changed
+    def _update(self, now):
+        grid, changed = self.grid, False
+        # Auto-repeat held movement keys every ARR_SEC once DAS_SEC has passed
+        for key, due in self._held.items():
+            while not self._resolving and due <= now and self.current.move(key, grid):
+                due += ARR_SEC
+                changed = True
+            self._held[key] = max(due, now)  # A blocked move is retried later
+
+        # Apply gravity to make pieces fall
+        if not self._resolving and now - self._last_fall >= self.fall_delay:
+            if self.current.move("down", grid):
+                changed = True
+            else:
+                # If can't move down, lock the piece; the merges, falls and cleared rows
+                # it causes are shown one step at a time
+                tiles, pos = self.current.get_min_bounded_tile_matrix(True)
+                self._resolving = grid.resolve_lock(tiles, pos)
+                grid.current_tetromino = None  # The locked tiles are part of the grid now
+                self._next_step = now
+            self._last_fall = now  # Reset the fall timer
+
+        # Advance the lock being resolved by one step whenever a step is due
+        if self._resolving and self._next_step <= now:
+            if next(self._resolving, None) is None:  # The lock is fully resolved
+                self._resolving = None
+                if not grid.game_over:
+                    # Prepare the next piece
+                    self.current, self.next_piece = self.next_piece, self.pieces.next()
+                    grid.current_tetromino = self.current
+                    if self.recorder:
+                        self.recorder.keyframe(grid, self.current, self.next_piece)  # Record the new board
+                    self._last_fall = time.time()  # The new piece starts falling now
+                    self._replay_deferred(now)
+            self._next_step = now + LOCK_STEP_SEC  # Show the new board before the next step
+            self._board = None  # The board changed
+            changed = True
+
+        if grid.game_over or (grid.win and not self._resolving):  # The game has ended
+            if self.recorder:
+                self.recorder.finish(grid, self.next_piece)  # Record the final board
+            if self.autosaver:
+                self.autosaver.clear()  # A finished game is not resumed
+            self._result = "over"
+            return True
+
+        if self.recorder:
+            self.recorder.pose(self.current)  # Record the piece if it moved
+        if self.autosaver and not self._resolving:  # Save the game if the autosave interval has passed
+            self.autosaver.save(now, grid, self.next_piece, self.pieces, self.fall_delay)
+        return changed
+
+    # A method that applies the key events deferred during the lock to the new
+    # piece, as if they were sent now
+    def _replay_deferred(self, now):
+        while self._deferred:
+            self._handle_key(self._deferred.popleft()._replace(time=now))
+
+    # A method that publishes a snapshot of the game
+    def _publish(self, board_changed=False):
+        grid = self.grid
+        if board_changed or self._board is None:
+            self._board = grid.exponent_matrix()
+            self._board.flags.writeable = False
+        current = grid.current_tetromino
+        key = None if current is None else (current, current.bottom_left_cell.x,
+                                            current.bottom_left_cell.y, current.rotation)
+        if key != self._current_key:
+            self._current_key, self._current_state = key, _piece_state(current)
+        if self.next_piece is not self._next_key:
+            self._next_key, self._next_state = self.next_piece, _piece_state(self.next_piece)
+        self._version += 1
+        snapshot = Snapshot(self._version, self._board, grid.score,
+                            self._current_state, self._next_state, self.paused,
+                            grid.win, self._result)
+        with self._published:
+            self._snapshot = snapshot
+            self._published.notify_all()
+
+
+def _piece_state(piece):
+    if piece is None:
+        return None
+    tiles = piece.tile_exponents()
+    tiles.flags.writeable = False
+    return PieceState(piece.type, tiles, piece.bottom_left_cell.x,
+                      piece.bottom_left_cell.y)
+
+
+# A function that builds a Tetromino from a PieceState of a snapshot
+def snapshot_piece(state):
+    if state is None:
+        return None
+    return Tetromino.from_tile_exponents(state.type, state.tiles, state.x, state.y)
@@ -0,0 +1,344 @@
+import functools  # used for caching the placements of a piece on a board
+import itertools  # used for enumerating the tile numbers of the pieces
+import os  # used for checking whether the cache file exists
+import sqlite3  # used for the cache of solved states on disk
+import numpy as np  # used for the boards
+from game_grid import merge_stack  # the merges of a stack of tiles
+from placements import distinct_rotations  # the orientations a piece is dropped in
+from tetromino import Tetromino, TETROMINO_TYPES  # the pieces that can come
+
+OBJECTIVES = ("score", "win")  # What a solver maximizes
+FLUSH_STATES = 10000  # Solved states written to the cache file in one transaction
+
+
+# A function that returns the pieces that can come next on a grid of the given
+# size as (tile matrix, probability) pairs. Every type is equally likely and
+# every tile is 2 or 4 with equal probability; pieces whose rotations are the
+# same (e.g. the O piece turned around) count as one.
+def piece_outcomes(grid_h, grid_w):
+    Tetromino.grid_height, Tetromino.grid_width = grid_h, grid_w
+    outcomes = {}
+    for shape in TETROMINO_TYPES:
+        shape_tiles = Tetromino(shape).tile_exponents()
+        cells = np.nonzero(shape_tiles)
+        for exponents in itertools.product((1, 2), repeat=len(cells[0])):
+            tiles = np.zeros_like(shape_tiles)
+            tiles[cells] = exponents
+            key = frozenset(m.tobytes() + bytes(m.shape) for _, m in distinct_rotations(tiles))
+            if key in outcomes:
+                outcomes[key][1] += 1
+            else:
+                outcomes[key] = [tiles, 1]
+    total = sum(count for _, count in outcomes.values())
+    return [(tiles, count / total) for tiles, count in outcomes.values()]
+
+
+# A class for solving small boards exhaustively: the value of a board with a
+# number of pieces left to play is the expected score (objective "score") or
+# probability of making 2048 (objective "win") when every piece is placed in
+# the best way once it is known, over every piece and tile numbers that can
+# come. The piece preview is not used, so the values are what a player gets
+# without it. Values are memoized under the packed board and the number of
+# pieces left, and kept in the SQLite file cache_path (if given) so later runs
+# start from the states solved before. A board and its mirror image have the
+# same value (the pieces and rules are symmetric), so they share one entry.
+# The work grows about a thousandfold with every piece (each of the 102 pieces
+# can land in a dozen or more ways): from the empty 6x4 board, two pieces are
+# solved in about 20 seconds.
+class Solver:
+    def __init__(self, grid_h, grid_w, objective="score", cache_path=None):
+        if objective not in OBJECTIVES:
+            raise ValueError("objective must be one of %s" % (OBJECTIVES,))
+        self.grid_height, self.grid_width = grid_h, grid_w
+        self.objective = objective
+        self.outcomes = piece_outcomes(grid_h, grid_w)
+        self._drops = [_drops(tiles) for tiles, _ in self.outcomes]
+        self._values = {}  # Values of the solved states, by key
+        self._unsaved = []  # (key, value) pairs not written to the cache file yet
+        self._cache = None
+        if cache_path is not None:
+            self._cache = _open_cache(cache_path, grid_h, grid_w, objective)
+        self._placements = functools.lru_cache(maxsize=1 << 16)(
+            lambda packed, outcome: self._play_all(packed, self._drops[outcome]))
+        self._resolve = functools.lru_cache(maxsize=1 << 18)(self._resolve_locked)
+
+    # A method that returns the value of a board (a matrix of exponents) with
+    # the given number of pieces left to play
+    def value(self, board, pieces):
+        return self._value(_canonical(np.asarray(board, dtype=np.uint8).tolist()), pieces)
+
+    # A method that returns the index of the best placement of a piece (tile
+    # matrix of exponents) on a board in enumerate_placements(board, tiles),
+    # and its value, with the given number of pieces left after this one
+    def best_placement(self, board, tiles, pieces):
+        values = self.placement_values(board, tiles, pieces)
+        best = int(np.argmax(values))
+        return best, float(values[best])
+
+    # A method that returns the value of every placement of a piece on a board
+    # (in the order of enumerate_placements(board, tiles)), with the given
+    # number of pieces left after this one; comparing the placement an agent
+    # chose with the best one shows how much the agent gives away
+    def placement_values(self, board, tiles, pieces):
+        results = self._play_all(_pack_rows(np.asarray(board, dtype=np.uint8).tolist()),
+                                 _drops(tiles))
+        return np.array([self._after(result, pieces) for result in results])
+
+    # A method that writes the states solved since the last flush to the cache
+    # file
+    def flush(self):
+        if self._cache is not None and self._unsaved:
+            with self._cache:
+                self._cache.executemany(
+                    "INSERT OR IGNORE INTO states VALUES (?, ?)", self._unsaved)
+        self._unsaved = []
+
+    # A method that writes the solved states to the cache file and closes it
+    def close(self):
+        self.flush()
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    # The number of states solved or read from the cache file by this solver
+    def __len__(self):
+        return len(self._values)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _value(self, packed, pieces):
+        if pieces <= 0:
+            return 0.0
+        key = pieces.to_bytes(2, "little") + packed
+        value = self._values.get(key)
+        if value is None and self._cache is not None:
+            row = self._cache.execute("SELECT value FROM states WHERE key = ?",
+                                      (key,)).fetchone()
+            if row is not None:
+                value = self._values[key] = row[0]
+        if value is None:
+            value = 0.0
+            for i, (_, probability) in enumerate(self.outcomes):
+                results = self._placements(packed, i)
+                value += probability * max(self._after(result, pieces - 1)
+                                           for result in results)
+            self._values[key] = value
+            if self._cache is not None:
+                self._unsaved.append((key, value))
+                if len(self._unsaved) >= FLUSH_STATES:
+                    self.flush()
+        return value
+
+    # A method that returns the value of a placement given as (points, packed
+    # board after it, game over, win), with the given number of pieces left
+    def _after(self, result, pieces):
+        points, packed, game_over, win = result
+        if self.objective == "win":
+            return 1.0 if win else 0.0 if game_over else self._value(packed, pieces)
+        return points + (0.0 if game_over or win else self._value(packed, pieces))
+
+    # A method that plays every placement of a piece (given by its _drops) on
+    # a packed board, in the order of placements.enumerate_placements, and
+    # returns (points, key of the board after it, game over, win) for each
+    def _play_all(self, packed, drops):
+        grid_h, grid_w = self.grid_height, self.grid_width
+        board = _unpack_flat(packed, grid_h * grid_w)
+        heights = [0] * grid_w  # Height of the stack of every column
+        for i, e in enumerate(board):
+            if e:
+                heights[i % grid_w] = i // grid_w + 1
+        results = []
+        for cells, bottom, top in drops:
+            for x in range(-bottom[0][0], grid_w - bottom[-1][0]):
+                # The piece lands where the first of its columns reaches the stack
+                y = max(heights[x + c] - b for c, b in bottom)
+                if y + top >= grid_h:  # Nothing is merged or cleared when the game is lost
+                    results.append((0, None, True, False))
+                    continue
+                locked = board[:]
+                for dy, c, e in cells:
+                    locked[(y + dy) * grid_w + x + c] = e
+                # Many placements of different pieces lock into the same board
+                points, key, win = self._resolve(bytes(locked))
+                results.append((points, key, False, win))
+        return results
+
+    # A method that applies the merges, falls and cleared rows of the rules to
+    # a board whose piece has just locked (the bytes of its exponent matrix),
+    # and returns the points scored, the key of the resulting board and
+    # whether 2048 was made
+    def _resolve_locked(self, locked):
+        grid_w = self.grid_width
+        rows = [[1 << e if e else 0 for e in locked[y:y + grid_w]]
+                for y in range(0, len(locked), grid_w)]
+        points, win = _resolve_rows(rows)
+        return points, _canonical([[n.bit_length() - 1 if n else 0 for n in row] for row in rows]), win
+
+
+# A function that returns the cells of a piece (tile matrix of exponents) in
+# each of its distinct rotations, as (cells, bottom, top): the cells as (row
+# above the bottom of the matrix, column, exponent), the lowest row of every
+# column the piece has a tile in, as (column, row) pairs from left to right,
+# and the highest row
+def _drops(tiles):
+    drops = []
+    for _, matrix in distinct_rotations(tiles):
+        n = len(matrix)
+        cells = [((n - 1) - int(r), int(c), int(matrix[r, c]))
+                 for r, c in zip(*np.nonzero(matrix))]
+        bottom = {}
+        for dy, c, _ in cells:
+            bottom[c] = min(bottom.get(c, n), dy)
+        drops.append((cells, sorted(bottom.items()), max(dy for dy, _, _ in cells)))
+    return drops
+
+
+# A function that unpacks a board packed two exponents per byte into a flat
+# list of count exponents, row by row from the bottom
+def _unpack_flat(packed, count):
+    flat = []
+    for byte in packed:
+        flat += (byte >> 4, byte & 15)
+    return flat[:count]
+
+
+# A function that packs a board given as a list of rows of exponents two per
+# byte, as dataset.pack_exponents does
+def _pack_rows(rows):
+    flat = [e for row in rows for e in row]
+    if len(flat) % 2:
+        flat.append(0)
+    return bytes([(a << 4) | b for a, b in zip(flat[0::2], flat[1::2])])
+
+
+# A function that returns the key of a board given as a list of rows of
+# exponents: the smaller of it and its mirror image, packed
+def _canonical(rows):
+    return min(_pack_rows(rows), _pack_rows([row[::-1] for row in rows]))
+
+
+# A function that resolves a lock as GameGrid.resolve_lock does, on a board
+# given as a list of rows (from the bottom) of tile numbers (0 for an empty
+# cell), which is changed in place; returns the points scored and whether 2048
+# was made. Plain numbers make it many times faster than the grid of Tile
+# objects, which matters when millions of placements are played.
+def _resolve_rows(rows):
+    points, win = _merge_rows(rows)
+    _settle_rows(rows)
+    full = [row for row in rows if all(row)]
+    if full:  # Clear the full rows; the rows above move down and may fall
+        points += sum(sum(row) for row in full)
+        rows[:] = [row for row in rows if not all(row)] + \
+            [[0] * len(rows[0]) for _ in full]
+        _settle_rows(rows)
+    return points, win
+
+
+# A function that merges the equal tiles of the stacks of every column until
+# none is left, as GameGrid._cascade_merge_steps
+def _merge_rows(rows):
+    grid_h, grid_w = len(rows), len(rows[0])
+    points, win, merged = 0, False, True
+    while merged:
+        if not any(a and a == b for lower, upper in zip(rows, rows[1:])
+                   for a, b in zip(lower, upper)):
+            break  # No tile sits on an equal one
+        merged = False
+        for x in range(grid_w):
+            y = 0
+            while y < grid_h:
+                if not rows[y][x]:
+                    y += 1
+                    continue
+                start = y
+                while y < grid_h and rows[y][x]:
+                    y += 1
+                if y - start < 2:
+                    continue
+                merges, score, made = merge_stack(tuple(rows[i][x] for i in range(start, y)))
+                for i in merges:
+                    rows[start + i][x] *= 2
+                    rows[start + i + 1][x] = 0
+                if merges:
+                    points += score
+                    win = win or made
+                    merged = True
+        if merged:
+            _settle_rows(rows)
+    return points, win
+
+
+# A function that makes the tiles not connected to the bottom row fall one row
+# at a time until they land, as GameGrid._settle_steps. The cells are bits of
+# an integer (bit y * width + x), so the tiles connected to the bottom row are
+# found with a few shifts instead of a search cell by cell.
+def _settle_rows(rows):
+    grid_h, grid_w = len(rows), len(rows[0])
+    bottom_row, not_left, not_right = _masks(grid_h, grid_w)
+    while True:
+        occupied = 0
+        for y in range(grid_h - 1, -1, -1):
+            for x in range(grid_w - 1, -1, -1):
+                occupied = (occupied << 1) | (1 if rows[y][x] else 0)
+        connected, grown = 0, occupied & bottom_row
+        while grown != connected:
+            connected = grown
+            grown = (connected | (connected << grid_w) | (connected >> grid_w) |
+                     ((connected << 1) & not_left) | ((connected >> 1) & not_right)) & occupied
+        # Only floating tiles with an empty cell below them can fall
+        if not occupied & ~connected & ~(occupied << grid_w) & ~bottom_row:
+            return
+        for y in range(1, grid_h):
+            for x in range(grid_w):
+                if rows[y][x] and not connected >> (y * grid_w + x) & 1 and not rows[y - 1][x]:
+                    rows[y - 1][x], rows[y][x] = rows[y][x], 0
+
+
+# A function that returns the masks of the cells of the bottom row, of the
+# cells not in the leftmost column and of those not in the rightmost column
+@functools.lru_cache(maxsize=None)
+def _masks(grid_h, grid_w):
+    row = (1 << grid_w) - 1
+    every_row = sum(1 << (y * grid_w) for y in range(grid_h))
+    return row, every_row * (row - 1), every_row * (row >> 1)
+
+
+def _open_cache(path, grid_h, grid_w, objective):
+    new = not os.path.exists(path)
+    db = sqlite3.connect(path)
+    settings = {"grid_h": grid_h, "grid_w": grid_w, "objective": objective}
+    with db:
+        db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value)")
+        db.execute("CREATE TABLE IF NOT EXISTS states (key BLOB PRIMARY KEY, value REAL) "
+                   "WITHOUT ROWID")
+        if new:
+            db.executemany("INSERT INTO settings VALUES (?, ?)", settings.items())
+    if dict(db.execute("SELECT key, value FROM settings")) != settings:
+        db.close()
+        raise ValueError("%s holds states of another board size or objective" % path)
+    return db
+
+
+if __name__ == "__main__":
+    import argparse  # used for reading the command line options
+    import time  # used for timing the solver
+    parser = argparse.ArgumentParser(
+        description="Solve small Tetris 2048 boards exhaustively")
+    parser.add_argument("--height", type=int, default=6)
+    parser.add_argument("--width", type=int, default=4)
+    parser.add_argument("--pieces", type=int, default=2,
+                        help="number of pieces to play from the empty board")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="score")
+    parser.add_argument("--cache", metavar="FILE",
+                        help="SQLite file that keeps the solved states between runs")
+    args = parser.parse_args()
+    start = time.time()
+    with Solver(args.height, args.width, args.objective, args.cache) as solver:
+        value = solver.value(np.zeros((args.height, args.width), np.uint8), args.pieces)
+        print("value of the empty %dx%d board with %d pieces: %.4f"
+              % (args.height, args.width, args.pieces, value))
+        print("%d states solved in %.1f s" % (len(solver), time.time() - start))
@@ -0,0 +1,169 @@
+import collections  # used for the records of the games
+import queue  # used for handing the records to the writer thread
+import sqlite3  # used for storing the records
+import sys  # used for reporting the records that could not be stored
+import threading  # used for writing the records in the background
+import time  # used for the duration and the end time of the games
+import traceback  # used for reporting the records that could not be stored
+from grid_events import Placement, Merge, RowCleared  # the events counted
+
+FLUSH_SEC = 2.0  # Longest time a record waits before it is committed
+FLUSH_RECORDS = 64  # Records committed in one transaction, at most
+
+# The result of a game: the difficulty it was played at, the final score, the
+# largest tile (0 if the grid was empty), the time it took in seconds, the
+# number of pieces placed, merges made and rows cleared, whether 2048 was
+# reached, when it ended (seconds since the epoch), and whether it was resumed
+# from an autosave, in which case the time and the counts cover only the part
+# played after it was resumed
+GameRecord = collections.namedtuple(
+    "GameRecord", ["difficulty", "score", "max_tile", "duration", "pieces",
+                   "merges", "rows_cleared", "win", "ended_at", "resumed"],
+    defaults=[False])
+
+
+# A class for counting the pieces, merges and cleared rows of a game from the
+# events of its grid (GameGrid.add_listener(counter)); resumed tells that the
+# game was resumed from an autosave, so the counting starts in its middle
+class GameCounter:
+    def __init__(self, resumed=False):
+        self.pieces = self.merges = self.rows_cleared = 0
+        self.started_at = time.time()
+        self.resumed = resumed
+
+    def __call__(self, events):
+        for event in events:
+            if isinstance(event, Placement):
+                self.pieces += 1
+            elif isinstance(event, Merge):
+                self.merges += 1
+            elif isinstance(event, RowCleared):
+                self.rows_cleared += 1
+
+    # A method that returns the GameRecord of the game that ended now
+    def record(self, difficulty, score, max_tile, win):
+        now = time.time()
+        return GameRecord(difficulty, score, max_tile, now - self.started_at,
+                          self.pieces, self.merges, self.rows_cleared, win, now,
+                          self.resumed)
+
+
+# A class for the SQLite database of game results. Records are handed to a
+# background thread that commits them in batches, so recording a game never
+# waits for the disk; queries also see the records not committed yet.
+class StatsStore:
+    def __init__(self, path):
+        self.path = path
+        db = self._connect()
+        db.execute("CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, "
+                   "difficulty TEXT NOT NULL, score INTEGER NOT NULL, "
+                   "max_tile INTEGER NOT NULL, duration REAL NOT NULL, "
+                   "pieces INTEGER NOT NULL, merges INTEGER NOT NULL, "
+                   "rows_cleared INTEGER NOT NULL, win INTEGER NOT NULL, "
+                   "ended_at REAL NOT NULL, resumed INTEGER NOT NULL DEFAULT 0)")
+        if "resumed" not in [row[1] for row in db.execute("PRAGMA table_info(games)")]:
+            # Databases made before resumed games were marked
+            db.execute("ALTER TABLE games ADD COLUMN resumed INTEGER NOT NULL DEFAULT 0")
+        # Leaderboards read the best scores of a difficulty straight from the index
+        db.execute("CREATE INDEX IF NOT EXISTS games_by_score "
+                   "ON games (difficulty, score DESC, ended_at)")
+        db.commit()
+        self._reader = db  # Used by the queries, on the thread that made the store
+        self._pending = []  # Records recorded but not committed yet
+        self._lock = threading.Lock()  # Held while _pending is used
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_records, daemon=True)
+        self._writer.start()
+
+    # A method that stores the GameRecord of a game
+    def record(self, game):
+        with self._lock:
+            self._pending.append(game)
+        self._queue.put(game)
+
+    # A method that returns the GameRecords of the best scores at a difficulty,
+    # best first (games with equal scores in the order they were played)
+    def leaderboard(self, difficulty, limit=10):
+        with self._lock:  # Taken before the query, so no record is missed
+            pending = [game for game in self._pending if game.difficulty == difficulty]
+        rows = self._reader.execute(
+            "SELECT difficulty, score, max_tile, duration, pieces, merges, "
+            "rows_cleared, win, ended_at, resumed FROM games WHERE difficulty = ? "
+            "ORDER BY score DESC, ended_at LIMIT ?", (difficulty, limit)).fetchall()
+        games = [GameRecord(*row[:7], bool(row[7]), row[8], bool(row[9])) for row in rows]
+        if pending:  # A record may be both pending and committed for a moment
+            games = sorted(set(games) | set(pending), key=lambda g: (-g.score, g.ended_at))
+        return games[:limit]
+
+    # A method that returns the best score at a difficulty (0 if no game was
+    # played at it)
+    def best_score(self, difficulty):
+        best = self.leaderboard(difficulty, 1)
+        return best[0].score if best else 0
+
+    # A method that waits until every record is committed
+    def flush(self):
+        self._queue.join()
+
+    # A method that commits the remaining records and closes the database
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        self._reader.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")  # Readers do not wait for the writer
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # The writer thread. Every record taken from the queue is marked done,
+    # even if it could not be stored, so that flush and close never wait
+    # forever; the database is opened again for the next batch after an error.
+    def _write_records(self):
+        db, stopping = None, False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            try:
+                if batch:
+                    if db is None:
+                        db = self._connect()
+                    with db:
+                        db.executemany("INSERT INTO games (difficulty, score, max_tile, "
+                                       "duration, pieces, merges, rows_cleared, win, "
+                                       "ended_at, resumed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       batch)
+            except Exception as error:  # The records are lost, the game goes on
+                print("Game results could not be stored (%d lost):" % len(batch), file=sys.stderr)
+                traceback.print_exception(type(error), error, error.__traceback__)
+                if db is not None:
+                    db.close()
+                    db = None
+            finally:
+                with self._lock:
+                    del self._pending[:len(batch)]
+                for _ in batch:
+                    self._queue.task_done()
+        if db is not None:
+            db.close()
+
+    # A method that waits for the next records and returns them with whether
+    # the store is being closed
+    def _next_batch(self):
+        game = self._queue.get()
+        if game is None:
+            self._queue.task_done()
+            return [], True
+        batch = [game]
+        deadline = time.time() + FLUSH_SEC
+        while len(batch) < FLUSH_RECORDS:  # Gather the records of the next moments
+            try:
+                game = self._queue.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                break
+            if game is None:
+                self._queue.task_done()
+                return batch, True  # Stop after this batch
+            batch.append(game)
+        return batch, False
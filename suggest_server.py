@@ -0,0 +1,282 @@
+import asyncio  # used for serving many clients and batching their requests
+import os  # used for removing stale Unix sockets
+import socket  # used by the client function
+import struct  # used for the messages of the protocol
+import numpy as np  # used for evaluating the boards
+from dataset import pack_exponents, unpack_exponents  # boards are sent packed
+from features import board_features, feature_names  # the vectorized evaluator
+from placements import enumerate_placements  # every way to drop a piece
+from tetromino import TETROMINO_TYPES  # piece types are sent as indices in it
+
+# Protocol: every message is a 4-byte little-endian length followed by that
+# many bytes.
+#   request:  grid height and width (1 byte each), the board as tile exponents
+#             packed two per byte (as in dataset.pack_exponents), then the
+#             current piece and the next piece, each as its type (index in
+#             TETROMINO_TYPES, or 255 for no next piece) and its tile matrix
+#             in its current orientation as exponents padded to 4x4 and
+#             packed in 8 bytes
+#   response: the number of placements (2 bytes), then for every placement,
+#             best first, the clockwise quarter turns (1 byte), the column of
+#             the bottom-left cell of the rotated piece (1 signed byte) and
+#             its evaluation (4-byte float)
+# A request that cannot be read gets a response with no placements.
+_LENGTH = struct.Struct("<I")
+_SIZE = struct.Struct("<BB")
+_PIECE = struct.Struct("<B8s")
+_COUNT = struct.Struct("<H")
+_PLACEMENT = struct.Struct("<Bbf")
+_NO_PIECE = 255
+_PIECE_SIZE = 4
+
+MAX_BATCH = 64  # Most requests evaluated together
+BATCH_WAIT_SEC = 0.002  # Longest time a request waits for others to join its batch
+GAME_OVER_SCORE = -1e9  # Evaluation of a placement that ends the game
+
+# Weights of the features of features.board_features in the evaluation of a
+# board (the column heights, not listed, have weight 0)
+WEIGHTS = {
+    "aggregate_height": -0.51,
+    "max_height": -0.2,
+    "holes": -0.36,
+    "bumpiness": -0.18,
+    "adjacent_equal": 0.3,
+    "max_exponent": 0.1,
+    "max_row": -0.05,
+    "max_col": 0.0,
+}
+
+
+# A function that evaluates a batch of requests, each a tuple of the board and
+# the tile matrices of the current and next pieces (next may be None), and
+# returns for every request its placements as (rotation, column, evaluation)
+# tuples, best first. With a next piece, a placement is worth the best
+# evaluation of the boards reachable by then placing the next piece. The
+# boards of all requests are evaluated with one call of board_features.
+def evaluate_requests(requests, weights=WEIGHTS):
+    # For every request, its placements and where the boards to evaluate for
+    # them start, or with a next piece, the start, end and game over flags of
+    # the boards that follow every placement
+    boards, parts, count = [], [], 0
+    for board, current, next_tiles in requests:
+        placements = enumerate_placements(board, current)
+        if next_tiles is None:
+            parts.append((placements, None, count))
+            boards.append(placements.boards)
+            count += len(placements.boards)
+            continue
+        followers = []
+        for i in range(len(placements.columns)):
+            after = enumerate_placements(placements.boards[i], next_tiles)
+            boards.append(after.boards)
+            followers.append((count, count + len(after.boards), after.game_over))
+            count += len(after.boards)
+        parts.append((placements, followers, None))
+
+    scores = np.empty(0)
+    if boards:
+        all_boards = np.concatenate(boards)
+        w = np.array([weights.get(name, 0.0)
+                      for name in feature_names(all_boards.shape[2])])
+        scores = board_features(all_boards) @ w
+
+    results = []
+    for placements, followers, start in parts:
+        if followers is None:
+            values = scores[start:start + len(placements.columns)].copy()
+        else:
+            values = np.empty(len(placements.columns))
+            for i, (start, stop, game_over) in enumerate(followers):
+                after = np.where(game_over, GAME_OVER_SCORE, scores[start:stop])
+                values[i] = after.max()
+        values[placements.game_over] = GAME_OVER_SCORE
+        order = np.argsort(-values, kind="stable")
+        results.append([(int(placements.rotations[i]), int(placements.columns[i]),
+                         float(values[i])) for i in order])
+    return results
+
+
+# A class for the server. Requests of all clients are put in one queue, from
+# which batches of up to MAX_BATCH requests are evaluated on a worker thread.
+class SuggestionServer:
+    def __init__(self, weights=WEIGHTS):
+        self.weights = weights
+        self._queue = None  # Requests waiting, as (request, future) pairs
+
+    # A coroutine that serves clients on a Unix socket at path, or on TCP
+    # port of host if path is None, until it is cancelled
+    async def serve(self, path=None, host="127.0.0.1", port=2048):
+        self._queue = asyncio.Queue()
+        if path is not None:
+            if os.path.exists(path):
+                os.remove(path)  # left by a server that did not stop cleanly
+            server = await asyncio.start_unix_server(self._handle_client, path)
+        else:
+            server = await asyncio.start_server(self._handle_client, host, port)
+        batcher = asyncio.ensure_future(self._evaluate_batches())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def _handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                length, = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                data = await reader.readexactly(length)
+                try:
+                    request = _unpack_request(data)
+                except (ValueError, struct.error, IndexError):
+                    placements = []
+                else:
+                    future = loop.create_future()
+                    await self._queue.put((request, future))
+                    placements = await future
+                writer.write(_pack_response(placements))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # The client disconnected
+        finally:
+            writer.close()
+
+    async def _evaluate_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + BATCH_WAIT_SEC
+            while len(batch) < MAX_BATCH:
+                timeout = deadline - loop.time()
+                try:  # Let the requests of other clients join the batch
+                    batch.append(self._queue.get_nowait() if timeout <= 0 else
+                                 await asyncio.wait_for(self._queue.get(), timeout))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+            try:
+                results = await loop.run_in_executor(
+                    None, evaluate_requests, [r for r, _ in batch], self.weights)
+            except Exception:  # Find the bad requests, so only they fail
+                results = await loop.run_in_executor(
+                    None, _evaluate_each, [r for r, _ in batch], self.weights)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+# A function that evaluates requests one at a time, giving no placements to
+# the requests whose evaluation fails
+def _evaluate_each(requests, weights):
+    results = []
+    for request in requests:
+        try:
+            results.append(evaluate_requests([request], weights)[0])
+        except Exception:  # A bad request must not stop the server
+            results.append([])
+    return results
+
+
+# A function for clients that asks the server at address (the path of a Unix
+# socket, or a (host, port) pair) for the placements of the current piece on
+# a board (a matrix of exponents as returned by GameGrid.exponent_matrix).
+# Pieces are given by their type ("I", "O", ...) and tile matrix as returned
+# by Tetromino.tile_exponents(). Returns (rotation, column, evaluation)
+# tuples, best first. A socket that is already connected to the server may be
+# given instead of an address.
+def suggest(address, board, current_type, current_tiles, next_type=None,
+            next_tiles=None):
+    sock = address if isinstance(address, socket.socket) else _connect(address)
+    try:
+        data = _pack_request(board, current_type, current_tiles, next_type,
+                             next_tiles)
+        sock.sendall(_LENGTH.pack(len(data)) + data)
+        length, = _LENGTH.unpack(_receive(sock, _LENGTH.size))
+        data = _receive(sock, length)
+    finally:
+        if sock is not address:
+            sock.close()
+    count, = _COUNT.unpack_from(data)
+    return [_PLACEMENT.unpack_from(data, _COUNT.size + i * _PLACEMENT.size)
+            for i in range(count)]
+
+
+def _connect(address):
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+def _receive(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("the server closed the connection")
+        data += chunk
+    return data
+
+
+def _pack_piece(piece_type, tiles):
+    if piece_type is None:
+        return _PIECE.pack(_NO_PIECE, bytes(8))
+    padded = np.zeros((_PIECE_SIZE, _PIECE_SIZE), np.uint8)
+    padded[:len(tiles), :len(tiles)] = tiles
+    return _PIECE.pack(TETROMINO_TYPES.index(piece_type),
+                       pack_exponents(padded, padded.shape).tobytes())
+
+
+# Size of the tile matrix of each tetromino type
+def _piece_size(type_index):
+    t = TETROMINO_TYPES[type_index]
+    return 4 if t == "I" else 2 if t == "O" else 3
+
+
+def _pack_request(board, current_type, current_tiles, next_type, next_tiles):
+    board = np.asarray(board, dtype=np.uint8)
+    return b"".join((_SIZE.pack(*board.shape),
+                     pack_exponents(board, board.shape).tobytes(),
+                     _pack_piece(current_type, current_tiles),
+                     _pack_piece(next_type, next_tiles)))
+
+
+def _unpack_request(data):
+    grid_h, grid_w = _SIZE.unpack_from(data)
+    board_size = (grid_h * grid_w + 1) // 2
+    board = unpack_exponents(np.frombuffer(data, np.uint8, board_size, _SIZE.size),
+                             (grid_h, grid_w))
+    pieces = []
+    for i in range(2):
+        type_index, tiles = _PIECE.unpack_from(data, _SIZE.size + board_size + i * _PIECE.size)
+        if type_index == _NO_PIECE:
+            pieces.append(None)
+            continue
+        n = _piece_size(type_index)
+        tiles = unpack_exponents(np.frombuffer(tiles, np.uint8), (_PIECE_SIZE, _PIECE_SIZE))
+        pieces.append(tiles[:n, :n])
+    if pieces[0] is None or not pieces[0].any():
+        raise ValueError("no current piece")
+    return board, pieces[0], pieces[1]
+
+
+def _pack_response(placements):
+    return b"".join([_LENGTH.pack(_COUNT.size + len(placements) * _PLACEMENT.size),
+                     _COUNT.pack(len(placements))] +
+                    [_PLACEMENT.pack(*p) for p in placements])
+
+
+if __name__ == "__main__":
+    import argparse  # used for reading the command line options
+    parser = argparse.ArgumentParser(
+        description="Serve move suggestions for Tetris 2048 boards")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2048)
+    args = parser.parse_args()
+    try:
+        asyncio.run(SuggestionServer().serve(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,135 @@
+import sys  # used for writing the frames to the standard output by default
+from tile import Tile, BACKGROUND_COLORS, LABELS  # the tile palette and labels
+from lib.color import Color  # used for the color of the score line
+
+# ANSI escape sequences used for drawing on a terminal
+CSI = "\x1b["  # Control sequence introducer
+CLEAR_SCREEN = CSI + "2J"
+HIDE_CURSOR, SHOW_CURSOR = CSI + "?25l", CSI + "?25h"
+RESET = CSI + "0m"
+SCORE_COLOR = Color(255, 255, 255)  # Color of the score line under the grid
+
+
+# Escape sequence that sets the text color (fg) or the background color (bg)
+def _sgr(color, background):
+   r, g, b = color.getRGB()
+   return "%s%d;2;%d;%d;%dm" % (CSI, 48 if background else 38, r, g, b)
+
+
+# A class for drawing a game grid and its falling tetromino on an ANSI
+# terminal, e.g. for watching games on a server over SSH. After the first
+# frame, only the cells that changed since the previous frame are written.
+class TerminalRenderer:
+   # A constructor that creates a renderer writing to the given text stream,
+   # with every cell drawn as cell_width characters
+   def __init__(self, out=None, cell_width=6):
+      self.out = sys.stdout if out is None else out
+      self.cell_width = cell_width
+      # Cells shown in the previous frame (0 for an empty cell, else the
+      # exponent of the tile number) and the score shown under the grid
+      self._shown, self._shown_score, self._lines = None, None, 0
+      # Background color code and text drawn for each exponent, built once
+      self._cell_colors = [_sgr(c, True) for c in BACKGROUND_COLORS]
+      self._cell_texts = [label.center(cell_width)[:cell_width]
+                          for label in LABELS]
+      self._cell_texts[0] = " " * cell_width
+      self._text_color = _sgr(Tile.foreground_color, False)
+
+   # A method that returns the cells of the next frame as a flat list in
+   # row-major order from the top row, with the falling tetromino included
+   def _cells(self, grid, tetromino):
+      h, w = grid.grid_height, grid.grid_width
+      cells = [0] * (h * w)
+      for row in range(h):
+         base = (h - 1 - row) * w
+         for col, tile in enumerate(grid.tile_matrix[row]):
+            if tile is not None:
+               cells[base + col] = tile.number.bit_length() - 1
+      if tetromino is not None:
+         n = len(tetromino.tile_matrix)
+         blc = tetromino.bottom_left_cell
+         for r in range(n):
+            for c in range(n):
+               tile = tetromino.tile_matrix[r][c]
+               x, y = blc.x + c, blc.y + (n - 1) - r
+               if tile is not None and 0 <= x < w and 0 <= y < h:
+                  cells[(h - 1 - y) * w + x] = tile.number.bit_length() - 1
+      return cells
+
+   # A method that draws the given grid and tetromino (if any) and returns
+   # the number of characters that were written
+   def render(self, grid, tetromino=None):
+      h, w = grid.grid_height, grid.grid_width
+      cells = self._cells(grid, tetromino)
+      empty_color = _sgr(grid.empty_cell_color, True)
+      parts = []
+      if self._shown is None or len(self._shown) != len(cells):
+         # Nothing usable is on the screen yet, so every cell is drawn
+         parts += [RESET, CLEAR_SCREEN, HIDE_CURSOR]
+         self._shown, self._shown_score = [None] * len(cells), None
+         self._lines = h + 1  # Lines used by the grid and the score
+      shown, cw = self._shown, self.cell_width
+      cursor, color = None, None  # where the cursor is, which color is set
+      for i, exp in enumerate(cells):
+         if exp == shown[i]:
+            continue
+         shown[i] = exp
+         line, column = i // w + 1, (i % w) * cw + 1
+         if cursor != (line, column):
+            parts.append("%s%d;%dH" % (CSI, line, column))
+         cell_color = self._cell_colors[exp] if exp else empty_color
+         if color is None:  # Set the color of the numbers before the first cell
+            parts.append(self._text_color)
+         if cell_color != color:
+            parts.append(cell_color)
+            color = cell_color
+         parts.append(self._cell_texts[exp])
+         cursor = (line, column + cw)
+      if grid.score != self._shown_score:
+         self._shown_score = grid.score
+         parts += [RESET, "%s%d;1H" % (CSI, h + 1), _sgr(SCORE_COLOR, False),
+                   "SCORE: %d" % grid.score, CSI + "K"]
+      if not parts:
+         return 0  # Nothing changed, so nothing is written
+      parts.append(RESET)
+      frame = "".join(parts)
+      self.out.write(frame)
+      self.out.flush()
+      return len(frame)
+
+   # A method that restores the terminal after the last frame
+   def close(self):
+      if self._shown is not None:
+         # Leave the cursor on the line below the score
+         self.out.write("%s%s%d;1H%s" % (RESET, CSI, self._lines + 1, SHOW_CURSOR))
+         self.out.flush()
+      self._shown, self._shown_score = None, None
+
+
+# A function for watching random drops on a terminal (for testing)
+def _main():
+   import random, time
+   from game_grid import GameGrid
+   from tetromino import Tetromino
+   grid_h, grid_w = 20, 12
+   Tetromino.grid_height, Tetromino.grid_width = grid_h, grid_w
+   grid, renderer = GameGrid(grid_h, grid_w), TerminalRenderer()
+   try:
+      while not grid.game_over and not grid.win:
+         piece = Tetromino(random.choice("IOZJLST"))
+         for _ in range(random.randrange(4)):
+            piece.move("rotate", grid)
+         for _ in range(random.randrange(6)):
+            piece.move(random.choice(("left", "right")), grid)
+         while piece.move("down", grid):
+            renderer.render(grid, piece)
+            time.sleep(0.02)
+         tiles, pos = piece.get_min_bounded_tile_matrix(True)
+         grid.update_grid(tiles, pos)
+         renderer.render(grid)
+   finally:
+      renderer.close()
+
+
+if __name__ == "__main__":
+   _main()
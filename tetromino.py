@@ -10,11 +10,17 @@ import numpy as np
 # numpy (np) is imported for efficient matrix operations
 
 
+TETROMINO_TYPES = ('I', 'O', 'Z', 'J', 'L', 'S', 'T')
+# All possible tetromino shapes
+
+
 class Tetromino:
 # The Tetromino class is responsible for managing a falling Tetris piece
 # including its tile matrix, movement, rotation, and locking into the game grid
     # These will be set by the main program before any Tetromino is created
     grid_height, grid_width = None, None
+    # Lists reused by every draw call to collect the tiles to be drawn
+    _drawn_tiles, _drawn_xs, _drawn_ys = [], [], []
 
     # clockwise rotation matrix helper
     @staticmethod
@@ -22,13 +28,14 @@ class Tetromino:
         # A helper method that rotates a matrix 90 degrees clockwise
         return np.rot90(mat, k=3)   # 3×90° = -90° → clockwise
 
-    def __init__(self, shape: str):
+    def __init__(self, shape: str, rng=random):
         # The constructor initializes a new Tetromino with a specific shape
+        # (rng is the random number generator that picks the tile numbers)
         self.type = shape.upper()
         # Store the type of tetromino
 
         # every piece fits inside an N×N square
-        self.tile_matrix, n = self._make_tiles(self.type)
+        self.tile_matrix, n = self._make_tiles(self.type, rng)
         # Create the matrix of tiles based on the tetromino type
 
         # spawn above the grid at a random x so the piece body is inside
@@ -37,9 +44,11 @@ class Tetromino:
             Tetromino.grid_height - 1
         )
         # Position the tetromino at the top of the grid, centered horizontally
+        self.rotation = 0
+        # Number of clockwise quarter turns made since the tetromino was created
 
     # build the initial orientation & tile objects
-    def _make_tiles(self, t):
+    def _make_tiles(self, t, rng=random):
         # This method creates the initial tile matrix for a given tetromino type
         occ = []
         if t == 'I':
@@ -70,11 +79,34 @@ class Tetromino:
         m = np.full((n, n), None)
         # Create an empty n×n matrix filled with None
         for c, r in occ:
-            m[r][c] = Tile()
+            m[r][c] = Tile(rng.choice((2, 4)))
             # Place Tile objects at the specified positions to form the tetromino shape
         return m, n
         # Return the tile matrix and its dimension
 
+    def tile_exponents(self):
+        # Return the tile matrix as a matrix of exponents (0 for an empty cell, 1 for 2, 2 for 4, ...)
+        return np.array([[0 if t is None else t.number.bit_length() - 1 for t in row]
+                         for row in self.tile_matrix], dtype=np.uint8)
+
+    def set_tile_exponents(self, exponents):
+        # Put the numbers of a matrix of exponents (as returned by tile_exponents) on the tiles
+        for r, c in zip(*np.nonzero(exponents)):
+            self.tile_matrix[r][c] = Tile(1 << int(exponents[r][c]))
+
+    @staticmethod
+    def from_tile_exponents(shape, exponents, x, y, rotation=0):
+        # Create a tetromino of the given shape whose tiles have the numbers of a matrix of
+        # exponents (as returned by tile_exponents), with its bottom-left cell at (x, y)
+        # The fields are set here rather than by __init__, which would draw random tile numbers
+        piece = Tetromino.__new__(Tetromino)
+        piece.type = shape.upper()
+        piece.tile_matrix = np.full(exponents.shape, None)
+        piece.set_tile_exponents(exponents)
+        piece.bottom_left_cell = Point(x, y)
+        piece.rotation = rotation
+        return piece
+
     def get_cell_position(self, row, col):
         # Convert matrix coordinates to actual grid coordinates
         n = len(self.tile_matrix)
@@ -117,6 +149,7 @@ class Tetromino:
             self.bottom_left_cell.y -= 1
         elif direction == "rotate":
             self.tile_matrix = Tetromino._rot90(self.tile_matrix)
+            self.rotation = (self.rotation + 1) % 4
             # Rotate the tetromino 90 degrees clockwise.
         return True
         
@@ -164,6 +197,13 @@ class Tetromino:
     def draw(self, preview=False, offset_x=0, offset_y=0):
         # Draw the tetromino on the game screen or in the preview area.
         n = len(self.tile_matrix)
+        if preview:
+            base_x, base_y = offset_x, offset_y
+            # preview mode draws in a small 4×4 box top-right
+        else:
+            base_x, base_y = self.bottom_left_cell.x, self.bottom_left_cell.y
+        tiles, xs, ys = Tetromino._drawn_tiles, Tetromino._drawn_xs, Tetromino._drawn_ys
+        tiles.clear(); xs.clear(); ys.clear()
         for r in range(n):
             for c in range(n):
                 # Iterate through each cell in the matrix.
@@ -171,13 +211,30 @@ class Tetromino:
                 if t is None:
                     continue
                     # Skip empty cells.
-                pos = self.get_cell_position(r, c)
-                # Calculate the position to draw the tile.
-                # preview mode draws in a small 4×4 box top-right
-                if preview:
-                    pos.x = offset_x + c
-                    pos.y = offset_y + (n - 1) - r
-                    # Adjust position for preview mode with offset.
-                if pos.y < Tetromino.grid_height or preview:
-                    t.draw(pos)
-                    # Draw the tile if it's within the grid or in preview mode.
+                y = base_y + (n - 1) - r
+                # Calculate the position to draw the tile without allocating a Point.
+                if y < Tetromino.grid_height or preview:
+                    tiles.append(t)
+                    xs.append(base_x + c)
+                    ys.append(y)
+                    # Collect the tile if it's within the grid or in preview mode.
+        Tile.draw_tiles(tiles, xs, ys)
+        # Draw all collected tiles in one batch.
+
+
+class PieceStream:
+# The PieceStream class generates the sequence of tetrominoes of a game from a seed.
+# Piece i only depends on the seed and i, so the whole state of the stream is
+# these two numbers: games with the same seed get the same pieces and tiles,
+# and a stream can be restored without replaying it.
+    def __init__(self, seed=None, index=0):
+        self.seed = random.getrandbits(63) if seed is None else seed
+        # A random seed is picked if none is given
+        self.index = index
+        # Number of pieces generated so far
+
+    def next(self):
+        # Create the next tetromino of the sequence with random type and tile numbers
+        rng = random.Random((self.seed << 32) + self.index)
+        self.index += 1
+        return Tetromino(rng.choice(TETROMINO_TYPES), rng)
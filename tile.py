@@ -2,45 +2,56 @@ import lib.stddraw as stddraw  # used for drawing the tiles to display them
 from lib.color import Color  # used for coloring the tiles
 import random
 
+# RGB colors of the tile backgrounds keyed by the tile numbers
+_PALETTE = {
+   2:  (151, 178, 199),  # Light blue for lowest value
+   4:  (118, 150, 175),
+   8:  (100, 130, 155),
+   16: (82, 110, 135),
+   32: (68,  92, 115),
+   64: (55,  75,  95),
+   128:(230, 167, 70),   # Transitions to orange/yellow hues
+   256:(232, 149, 10),
+   512:(237, 118, 15),
+   1024:(237,  90,  2),
+   2048:(242,  75, 12),  # Target value is bright orange
+   4096:(255, 0, 0),     # Higher values use red
+   8192:(255,0,0),
+   16384:(255,0,0)
+}
+# Background Color of every tile number indexed by its exponent (2 -> 1,
+# 4 -> 2, ...), computed once at import so that tiles only look colors up.
+# Numbers missing from the palette use dark gray (40,40,40).
+BACKGROUND_COLORS = tuple(Color(*_PALETTE.get(1 << exp, (40, 40, 40)))
+                          for exp in range(64))
+# Text drawn on every tile number indexed by its exponent, also built once
+LABELS = tuple(str(1 << exp) for exp in range(64))
+
 # A class for modeling numbered tiles as in 2048
 class Tile:
+   # Tiles are created for every piece and copied on every lock, so they
+   # only store their number and background color (no per-object __dict__)
+   __slots__ = ("number", "background_color")
+
    # Class variables shared among all Tile objects
    # These values are the same for all tile instances
    boundary_thickness = 0.004  # Sets the thickness of borders around tiles
    font_family, font_size = "Arial", 14  # Defines text appearance for tile numbers
+   foreground_color = Color(0, 25, 51)  # Color for the number text
+   box_color = Color(0, 100, 200)  # Color for the tile's border
 
-   # A constructor that creates a tile with either 2 or 4 as the number on it
-   def __init__(self):
+   # A constructor that creates a tile with the given number on it, or with
+   # either 2 or 4 (chosen randomly) if no number is given
+   def __init__(self, number=None):
         # Randomly choose between 2 and 4 for new tile value
-        self.number = random.choice((2, 4))
+        self.number = random.choice((2, 4)) if number is None else number
         # Initialize colors based on the tile's number
         self._set_colors()
 
    # A method that assigns colors to the tile based on its number value
    def _set_colors(self):
-        # Dictionary mapping each possible tile value to an RGB color tuple
-        palette = {
-            2:  (151, 178, 199),  # Light blue for lowest value
-            4:  (118, 150, 175),
-            8:  (100, 130, 155),
-            16: (82, 110, 135),
-            32: (68,  92, 115),
-            64: (55,  75,  95),
-            128:(230, 167, 70),   # Transitions to orange/yellow hues
-            256:(232, 149, 10),
-            512:(237, 118, 15),
-            1024:(237,  90,  2),
-            2048:(242,  75, 12),  # Target value is bright orange
-            4096:(255, 0, 0),     # Higher values use red
-            8192:(255,0,0),
-            16384:(255,0,0)
-        }
-        # Get RGB values from palette or use dark gray (40,40,40) if not found
-        r, g, b = palette.get(self.number, (40, 40, 40))
-        # Create Color objects for the tile's appearance
-        self.background_color = Color(r, g, b)  # Fill color for the tile
-        self.foreground_color = Color(0, 25, 51)  # Color for the number text
-        self.box_color = Color(0, 100, 200)  # Color for the tile's border
+        # Look the fill color up by the exponent of the number
+        self.background_color = BACKGROUND_COLORS[self.number.bit_length() - 1]
 
    # A method that doubles the number on the tile and updates its colors
    def double(self):
@@ -51,18 +62,26 @@ class Tile:
 
    # A method for drawing this tile at a given position with a given length
    def draw(self, position, length=1):  # length defaults to 1
-      # Draw the tile as a filled square with the background color
-      stddraw.setPenColor(self.background_color)
-      stddraw.filledSquare(position.x, position.y, length / 2)
-      
-      # Draw the bounding box around the tile
-      stddraw.setPenColor(self.box_color)
+      Tile.draw_tiles((self,), (position.x,), (position.y,), length)
+
+   # A method for drawing many tiles in one call, tiles[i] centered at
+   # (xs[i], ys[i]); each layer of the tiles is a single batched stddraw call
+   @staticmethod
+   def draw_tiles(tiles, xs, ys, length=1):
+      half = length / 2
+      # Draw the tiles as filled squares with their background colors
+      stddraw.filledSquares(xs, ys, half,
+                            [tile.background_color for tile in tiles])
+
+      # Draw the bounding boxes around the tiles
+      stddraw.setPenColor(Tile.box_color)
       stddraw.setPenRadius(Tile.boundary_thickness)
-      stddraw.square(position.x, position.y, length / 2)
+      stddraw.squares(xs, ys, half)
       stddraw.setPenRadius()  # Reset the pen radius to its default value
-      
-      # Draw the number on the tile
-      stddraw.setPenColor(self.foreground_color)
+
+      # Draw the numbers on the tiles
+      stddraw.setPenColor(Tile.foreground_color)
       stddraw.setFontFamily(Tile.font_family)
       stddraw.setFontSize(Tile.font_size)
-      stddraw.text(position.x, position.y, str(self.number))
+      stddraw.texts(xs, ys,
+                    [LABELS[tile.number.bit_length() - 1] for tile in tiles])
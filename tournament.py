@@ -0,0 +1,181 @@
+import collections  # used for the records of the games and the result
+import importlib  # used for loading agents given by name
+import math  # used for the statistical test
+import multiprocessing  # used for playing the games on all cores
+import random  # used for the random choices of the agents
+import numpy as np  # used for the boards and the scores
+from game_grid import GameGrid  # used for playing the placements
+from placements import enumerate_placements, play_placement
+from suggest_server import evaluate_requests  # used by the built-in agents
+from tetromino import Tetromino, PieceStream  # the pieces of the games
+
+# An agent is a function agent(board, current, next_tiles, placements, rng)
+# that gets the board (a matrix of exponents), the tile matrices of the
+# current and next pieces, the placements.Placements of the current piece and
+# a random.Random, and returns the index of the placement to play. Agents are
+# given to the tournament as module-level functions or as "module:function"
+# names, so that the worker processes can load them.
+
+# The outcome of a game: the final score, whether 2048 was reached, and the
+# number of pieces placed
+GameResult = collections.namedtuple("GameResult", ["score", "win", "pieces"])
+# The outcome of a tournament: the games played by each agent (the games of
+# a pair have the same index), the decision ("A" or "B" if that agent scores
+# more, "equal" if a difference of delta or more was ruled out, "undecided" if
+# max_games were played first) and the log-likelihood ratios of the tests
+TournamentResult = collections.namedtuple(
+    "TournamentResult", ["games_a", "games_b", "decision", "llr_a", "llr_b"])
+
+
+# An agent that plays a random placement
+def random_agent(board, current, next_tiles, placements, rng):
+    return rng.randrange(len(placements.columns))
+
+
+# An agent that plays the placement with the best evaluation of the move
+# suggestion server, without looking at the next piece
+def greedy_agent(board, current, next_tiles, placements, rng):
+    return _best(placements, evaluate_requests([(board, current, None)])[0])
+
+
+# An agent that plays the placement with the best evaluation of the move
+# suggestion server, looking one piece ahead
+def lookahead_agent(board, current, next_tiles, placements, rng):
+    return _best(placements, evaluate_requests([(board, current, next_tiles)])[0])
+
+
+# A function that plays a game without drawing it: the pieces come from the
+# PieceStream of seed, the agent is given a random.Random of seed, and the
+# game stops after max_pieces pieces if it has not ended before
+def play_game(agent, seed, grid_h=20, grid_w=12, max_pieces=1000):
+    agent = load_agent(agent)
+    Tetromino.grid_height, Tetromino.grid_width = grid_h, grid_w
+    pieces, rng = PieceStream(seed), random.Random(seed)
+    grid = GameGrid(grid_h, grid_w)
+    board = grid.exponent_matrix()
+    current, score, win, count = pieces.next().tile_exponents(), 0, False, 0
+    next_tiles = pieces.next().tile_exponents()
+    while count < max_pieces:
+        placements = enumerate_placements(board, current)
+        i = agent(board, current, next_tiles, placements, rng)
+        board, points, game_over = play_placement(board, current, placements, i, grid)
+        score += points
+        win = win or grid.win
+        count += 1
+        if game_over or win:
+            break
+        current, next_tiles = next_tiles, pieces.next().tile_exponents()
+    return GameResult(score, win, count)
+
+
+# A function that plays two agents against each other on paired games (both
+# agents play the game of every seed, with the same pieces and tiles) on a
+# pool of worker processes, and stops as soon as the scores show that one
+# agent is better or that neither is better by a meaningful margin.
+#
+# The test is a sequential probability ratio test (SPRT) on the pairs: a pair
+# counts for the agent with the higher score (ties are left out), and two
+# tests run side by side, each of the hypothesis that an agent wins a pair with
+# probability 0.5 against the hypothesis that it wins with probability
+# 0.5 + delta. The tournament stops when one test accepts its agent as better,
+# or both reject them, with error rates of about alpha (false difference) and
+# beta (missed difference of delta).
+def run_tournament(agent_a, agent_b, delta=0.1, alpha=0.05, beta=0.05,
+                   max_games=10000, first_seed=0, workers=None, grid_h=20,
+                   grid_w=12, max_pieces=1000, callback=None):
+    upper = math.log((1 - beta) / (alpha / 2))  # Accept that an agent is better
+    lower = math.log(beta / (1 - alpha / 2))  # Reject that an agent is better
+    win_step = math.log((0.5 + delta) / 0.5)
+    loss_step = math.log((0.5 - delta) / 0.5)
+    games_a, games_b = [], []
+    llr_a = llr_b = 0.0  # Log-likelihood ratios of "A is better" and "B is better"
+    decision = "undecided"
+    tasks = ((agent_a, agent_b, seed, grid_h, grid_w, max_pieces)
+             for seed in range(first_seed, first_seed + max_games))
+    with multiprocessing.Pool(workers) as pool:
+        # Pairs are handled in seed order, so a tournament always stops after
+        # the same games whatever the number of workers
+        for game_a, game_b in pool.imap(_play_pair, tasks):
+            games_a.append(game_a)
+            games_b.append(game_b)
+            if game_a.score > game_b.score:
+                llr_a, llr_b = llr_a + win_step, llr_b + loss_step
+            elif game_b.score > game_a.score:
+                llr_a, llr_b = llr_a + loss_step, llr_b + win_step
+            if callback:
+                callback(games_a, games_b, llr_a, llr_b)
+            if llr_a >= upper:
+                decision = "A"
+            elif llr_b >= upper:
+                decision = "B"
+            elif llr_a <= lower and llr_b <= lower:
+                decision = "equal"
+            else:
+                continue
+            break  # Leaving the pool stops the games still being played
+    return TournamentResult(games_a, games_b, decision, llr_a, llr_b)
+
+
+# A function that returns the mean score difference of the paired games of a
+# tournament (A minus B) with the half width of its 95% confidence interval,
+# and the difference of the win rates
+def summarize(result):
+    diffs = np.array([a.score - b.score for a, b in zip(result.games_a, result.games_b)],
+                     dtype=np.float64)
+    half_width = 1.96 * diffs.std(ddof=1) / math.sqrt(len(diffs)) if len(diffs) > 1 else math.inf
+    win_diff = np.mean([a.win for a in result.games_a]) - np.mean([b.win for b in result.games_b])
+    return float(diffs.mean()), float(half_width), float(win_diff)
+
+
+def _play_pair(task):
+    agent_a, agent_b, seed, grid_h, grid_w, max_pieces = task
+    return (play_game(agent_a, seed, grid_h, grid_w, max_pieces),
+            play_game(agent_b, seed, grid_h, grid_w, max_pieces))
+
+
+# A function that returns the agent function given by a function or a
+# "module:function" name
+def load_agent(agent):
+    if callable(agent):
+        return agent
+    module, _, name = agent.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+# A function that returns the index in placements of the best of the ranked
+# (rotation, column, evaluation) tuples
+def _best(placements, ranked):
+    best_rotation, best_column = ranked[0][:2]
+    return int(np.nonzero((placements.rotations == best_rotation) &
+                          (placements.columns == best_column))[0][0])
+
+
+if __name__ == "__main__":
+    import argparse  # used for reading the command line options
+    parser = argparse.ArgumentParser(
+        description="Play two Tetris 2048 agents against each other on paired games")
+    parser.add_argument("agent_a", help='an agent function, e.g. "tournament:greedy_agent"')
+    parser.add_argument("agent_b")
+    parser.add_argument("--delta", type=float, default=0.1,
+                        help="smallest difference of the pair win rate from 0.5 to detect")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--max-games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--height", type=int, default=20)
+    parser.add_argument("--width", type=int, default=12)
+    parser.add_argument("--max-pieces", type=int, default=1000)
+    args = parser.parse_args()
+
+    def report(games_a, games_b, llr_a, llr_b):
+        if len(games_a) % 10 == 0:
+            print("%d games, LLR A %.2f, LLR B %.2f" % (len(games_a), llr_a, llr_b))
+
+    result = run_tournament(args.agent_a, args.agent_b, args.delta, args.alpha,
+                            args.beta, args.max_games, args.seed, args.workers,
+                            args.height, args.width, args.max_pieces, report)
+    mean, half_width, win_diff = summarize(result)
+    print("decision after %d games: %s" % (len(result.games_a), result.decision))
+    print("score difference (A - B): %.1f +- %.1f" % (mean, half_width))
+    print("win rate difference (A - B): %.3f" % win_diff)
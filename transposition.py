@@ -0,0 +1,166 @@
+import struct  # used for the header of the shared table
+import sys  # used for checking which shared memory options are available
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np  # used for the entries of the table and the board hashes
+
+# Random 64-bit keys of Zobrist hashing: one per cell and tile exponent. The
+# hash of a board is the XOR of the keys of its tiles, so equal boards get the
+# same hash in every process, and boards that differ in one tile usually
+# differ in every bit of the hash.
+_MAX_CELLS = 64 * 64
+_ZOBRIST = np.random.default_rng(0x2048).integers(
+    1, 1 << 63, size=(_MAX_CELLS, 16), dtype=np.uint64)
+_EMPTY_BOARD = np.uint64(0x9E3779B97F4A7C15)  # Hash of a board without tiles
+
+
+# A function that returns the 64-bit hash of a board (a matrix of tile
+# exponents as returned by GameGrid.exponent_matrix), or a vector with the
+# hash of every board of a batch along the first axis
+def board_hash(boards):
+    boards = np.asarray(boards)
+    single = boards.ndim == 2
+    flat = boards.reshape(1 if single else len(boards), -1)
+    keys = _ZOBRIST[np.arange(flat.shape[1]), flat]
+    keys[flat == 0] = 0
+    hashes = np.bitwise_xor.reduce(keys, axis=1) ^ _EMPTY_BOARD
+    return int(hashes[0]) if single else hashes
+
+
+# Layout of the shared memory block: a header with a magic number, the number
+# of buckets and the current generation, then the buckets. Every bucket holds
+# BUCKET_SIZE entries of two 64-bit words: the key XORed with the data, and the
+# data (value as a 32-bit float, depth, generation and a bit marking the entry
+# as used). Entries are read and written without locks; a read that races with
+# a write sees a check word that does not match the key and is a miss, so a
+# torn entry is never returned.
+_HEADER = struct.Struct("<8sQQ")
+_HEADER_SIZE = 64
+_MAGIC = b"T48TTv1\0"
+BUCKET_SIZE = 4
+_USED = 1 << 63
+_MAX_DEPTH = (1 << 16) - 1
+_GENERATIONS = 1 << 15
+
+
+# A class for a fixed-size hash table of search results shared by all the
+# processes of a machine, e.g. the workers of a multiprocessing.Pool. A table
+# is created by one process, and the others attach to it by name; a table can
+# also be passed to workers as an argument, which attaches to it. Keys are
+# 64-bit integers such as the board_hash of a position. When a bucket is
+# full, entries from older generations (see new_generation) are replaced
+# first, then the entry searched to the smallest depth.
+class TranspositionTable:
+    def __init__(self, entries=1 << 20, name=None):
+        if name is None:  # Create a new table with at least the given entries
+            buckets = 1 << max(0, (entries - 1) // BUCKET_SIZE).bit_length()
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=_HEADER_SIZE + buckets * BUCKET_SIZE * 16)
+            self._shm.buf[:_HEADER.size] = _HEADER.pack(_MAGIC, buckets, 0)
+            self._owner = True
+        else:  # Attach to the table created by another process
+            self._shm = _attach(name)
+            magic, buckets, _ = _HEADER.unpack_from(self._shm.buf)
+            if magic != _MAGIC:
+                raise ValueError(name + " is not a transposition table")
+            self._owner = False
+        self.name = self._shm.name
+        self.buckets = buckets
+        self._header = np.ndarray((3,), np.uint64, self._shm.buf)
+        self._entries = np.ndarray((buckets, BUCKET_SIZE, 2), np.uint64,
+                                   self._shm.buf, _HEADER_SIZE)
+
+    # Tables are passed to other processes by name
+    def __reduce__(self):
+        return TranspositionTable, (0, self.name)
+
+    def __len__(self):
+        return self.buckets * BUCKET_SIZE
+
+    # A method that starts a new generation, e.g. before a new search, so that
+    # the entries of earlier searches are replaced before any others
+    def new_generation(self):
+        self._header[2] = (int(self._header[2]) + 1) % _GENERATIONS
+
+    # A method that returns the (value, depth) stored for key, or None
+    def probe(self, key):
+        key = np.uint64(key)
+        # Entries are checked and decoded from one copy, since another process
+        # may write the bucket at any time: an entry changed while it was
+        # copied fails the check instead of giving another position's value
+        bucket = self._entries[int(key) & (self.buckets - 1)].copy()
+        found = np.nonzero((bucket[:, 0] ^ bucket[:, 1]) == key)[0]
+        for i in found:
+            data = int(bucket[i, 1])
+            if data & _USED:
+                return _unpack_value(data), (data >> 32) & _MAX_DEPTH
+        return None
+
+    # A method that stores the value found for key by a search of the given
+    # depth, unless the table keeps a deeper result of this generation for it
+    def store(self, key, value, depth):
+        key = np.uint64(key)
+        bucket = self._entries[int(key) & (self.buckets - 1)]
+        generation = int(self._header[2])
+        entries = bucket.copy()  # The replacement is decided on one copy, as in probe
+        checks, datas = entries[:, 0] ^ entries[:, 1], entries[:, 1]
+        slot, victim_rank = None, None
+        for i in range(BUCKET_SIZE):
+            data = int(datas[i])
+            if not data & _USED:
+                rank = (0, 0)  # Empty slots are filled first
+            elif checks[i] == key:
+                if data >> 48 & (_GENERATIONS - 1) == generation and \
+                        (data >> 32) & _MAX_DEPTH > depth:
+                    return  # A deeper search of this position is kept
+                slot = i
+                break
+            else:  # Replace old generations first, then shallow searches
+                old = (data >> 48 & (_GENERATIONS - 1)) != generation
+                rank = (1 if old else 2, (data >> 32) & _MAX_DEPTH)
+            if victim_rank is None or rank < victim_rank:
+                slot, victim_rank = i, rank
+        data = _USED | generation << 48 | min(depth, _MAX_DEPTH) << 32 | \
+            int(np.float32(value).view(np.uint32))
+        data = np.uint64(data)
+        bucket[slot, 1] = data
+        bucket[slot, 0] = key ^ data
+
+    # A method that empties the table
+    def clear(self):
+        self._entries[:] = 0
+
+    # A method that detaches this process from the table, which is freed when
+    # every process has closed it and its creator has called unlink
+    def close(self):
+        self._header = self._entries = None
+        self._shm.close()
+
+    # A method that frees the table once every process has closed it
+    def unlink(self):
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self._owner:
+            self.unlink()
+
+
+def _unpack_value(data):
+    return float(np.uint32(data & 0xFFFFFFFF).view(np.float32))
+
+
+# Attaching to a block of shared memory from another process must not make
+# this process free it when it exits, which older Pythons do unless the block
+# is kept out of the resource tracker
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register